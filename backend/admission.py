@@ -0,0 +1,209 @@
+"""Admission control for the Preferio API.
+
+Every request is put in one of three classes: reads (GET/HEAD), uploads
+(attachments and imports) and writes (every other change). Each class has
+its own limit on requests in flight and a bounded queue in front of it. A
+request that finds the queue full is turned away at once with 429. A
+request that waits longer than the class's deadline gets 503. Both carry a
+``Retry-After`` estimated from recent service times, so clients back off
+instead of piling more work onto a saturated server.
+
+Writes and uploads spend most of their time in the ``save_*`` helpers on
+the event loop. Capping how many run at once keeps a month-end burst of
+edits from monopolising the loop, so reads keep being served between them.
+Health checks, ``/metrics``, ``/admin`` and CORS preflights are never
+limited.
+
+Limits are set per class as ``"in_flight,queued,deadline_seconds"``::
+
+    PREFERIO_ADMISSION_READS=64,256,5
+    PREFERIO_ADMISSION_WRITES=4,32,2
+    PREFERIO_ADMISSION_UPLOADS=2,8,10
+
+``PREFERIO_ADMISSION=0`` turns admission control off.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+
+import metrics
+
+DEFAULT_LIMITS = {
+    "reads": "64,256,5",
+    "writes": "4,32,2",
+    "uploads": "2,8,10",
+}
+EXEMPT_PATHS = ("/", "/health", "/metrics")
+EXEMPT_PREFIXES = ("/admin/",)
+UPLOAD_SUFFIXES = ("/attachments", "/import")
+SERVICE_TIME_WEIGHT = 0.2  # EWMA weight of the newest request's duration
+
+
+def enabled():
+    return os.getenv("PREFERIO_ADMISSION", "1").lower() not in ("0", "false", "no")
+
+
+def configured_limits():
+    limits = {}
+    for route_class, default in DEFAULT_LIMITS.items():
+        value = os.getenv(f"PREFERIO_ADMISSION_{route_class.upper()}", default)
+        try:
+            in_flight, queued, deadline = value.split(",")
+            limits[route_class] = (int(in_flight), int(queued), float(deadline))
+        except ValueError:
+            print(f"Ignoring invalid PREFERIO_ADMISSION_{route_class.upper()}={value!r}")
+            in_flight, queued, deadline = default.split(",")
+            limits[route_class] = (int(in_flight), int(queued), float(deadline))
+    return limits
+
+
+def classify(method, path):
+    """The admission class of a request, or None if it is never limited"""
+    if method == "OPTIONS" or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if method in ("GET", "HEAD"):
+        return "reads"
+    if method == "POST" and path.rstrip("/").endswith(UPLOAD_SUFFIXES):
+        return "uploads"
+    return "writes"
+
+
+class Rejected(Exception):
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """A FIFO queue in front of at most `max_in_flight` requests.
+
+    Only used from the event loop, so it needs no locking. A finishing
+    request hands its slot straight to the oldest waiter."""
+
+    def __init__(self, route_class, max_in_flight, max_queued, deadline):
+        self.route_class = route_class
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.deadline = deadline
+        self.in_flight = 0
+        self.service_time = 0.05
+        self._waiters = deque()
+
+    def retry_after(self):
+        """Seconds until the queue has likely drained, rounded up"""
+        backlog = self.in_flight + len(self._waiters)
+        return max(1, math.ceil(self.service_time * backlog / max(self.max_in_flight, 1)))
+
+    async def acquire(self):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self._admit(0.0)
+            return
+        if len(self._waiters) >= self.max_queued:
+            self._reject(429, "queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.deadline)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            self._reject(503, "deadline")
+        except asyncio.CancelledError:  # client went away while queued
+            self._forget(waiter)
+            raise
+        # The slot was handed over by release(); in_flight already counts it
+        metrics.admission_queue_wait.observe(time.perf_counter() - start, route_class=self.route_class)
+        self._update_gauges()
+
+    def release(self, duration):
+        self.service_time += SERVICE_TIME_WEIGHT * (duration - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+    def _admit(self, waited):
+        self.in_flight += 1
+        metrics.admission_queue_wait.observe(waited, route_class=self.route_class)
+        self._update_gauges()
+
+    def _forget(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # Granted just as the wait ended: pass the slot on
+            self.release(self.service_time)
+        else:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        self._update_gauges()
+
+    def _reject(self, status, reason):
+        metrics.admission_rejected.inc(route_class=self.route_class, reason=reason)
+        raise Rejected(status, reason, self.retry_after())
+
+    def _update_gauges(self):
+        metrics.admission_in_flight.set(self.in_flight, route_class=self.route_class)
+        metrics.admission_queue_depth.set(len(self._waiters), route_class=self.route_class)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying a Limiter per route class"""
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        self.limiters = {route_class: Limiter(route_class, *limit)
+                         for route_class, limit in (limits or configured_limits()).items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters.get(classify(scope.get("method", ""), scope.get("path", "")))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Rejected as e:
+            await _send_rejection(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            # Handlers mostly run without yielding (the save_* helpers block the
+            # loop), so yield once here: requests that arrived together all
+            # reach admission, and are counted, before any of them starts.
+            # Inside the try, so a cancellation here still releases the slot.
+            await asyncio.sleep(0)
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+
+async def _send_rejection(send, rejection):
+    message = "Too many requests" if rejection.status == 429 else "Server is busy"
+    body = json.dumps({"error": f"{message}, retry in {rejection.retry_after}s",
+                       "reason": rejection.reason}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": rejection.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(rejection.retry_after).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
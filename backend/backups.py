@@ -0,0 +1,371 @@
+"""Online backups and point-in-time restore of the report data.
+
+A backup is a directory under ``backups/snapshots/`` holding the report
+shards, the cold tier, attachments and landfill_data.json as they were at one
+instant. The store writes every file to a temporary file and renames it into
+place, so a file never changes once written and a backup can be made of hard
+links instead of copies. Taking one links the shard files on the event loop,
+where all writes happen, so no write can land halfway through. Writers are
+paused only for those few links. The cold tier and attachments can hold many
+files, so they are linked afterwards in a worker thread. A cold file that is
+about to be replaced or removed before then is linked first
+(``Backups.preserve``), which makes the backup copy-on-write. Where hard
+links are not supported, files are opened on the loop and copied in the
+thread.
+
+Between backups, every saved or deleted report is appended to a journal
+(``backups/journal/YYYY-MM-DD.ndjson``) by a background thread. Restoring to
+a point in time starts from the last backup taken at or before it and
+replays the journal up to that time. A backup is taken just before and just
+after a restore, so a restore can itself be undone.
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+from datetime import datetime
+
+import report_store
+from report_store import read_json_file, write_json_file
+
+BACKUP_DIR = os.getenv("PREFERIO_BACKUP_DIR", "backups")
+KEEP = int(os.getenv("PREFERIO_BACKUP_KEEP", "7"))
+BACKUP_EVERY_HOURS = float(os.getenv("PREFERIO_BACKUP_EVERY_HOURS", "24"))
+CHECK_EVERY_SECONDS = float(os.getenv("PREFERIO_BACKUP_CHECK_SECONDS", "300"))  # how often due() is asked
+POINTER_FILE = "landfill_data.json"
+ATTACHMENTS_DIR = "attachments"
+MANIFEST_FILE = "manifest.json"
+
+
+class RestoreError(Exception):
+    pass
+
+
+def _dir_name(moment):
+    return moment.strftime("%Y%m%dT%H%M%S%f")
+
+
+def parse_timestamp(value):
+    """An ISO 8601 timestamp as naive local time, like the rest of the data"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise RestoreError(f"Invalid timestamp: {value!r}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+class Journal:
+    """Appends report changes to one file per day from a background thread"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pending = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._write, name="preferio-journal", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def record(self, op, report):
+        """Queue one change. Serialized here, so later in-place edits are not picked up."""
+        moment = datetime.now()
+        line = json.dumps({"ts": moment.isoformat(timespec='microseconds'), "op": op, "id": report['id'],
+                           "report": report if op == "put" else None}, ensure_ascii=False)
+        self._pending.put((moment.date().isoformat(), line))
+
+    def flush(self):
+        """Block until everything recorded so far is on disk"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._pending.put(done)
+        done.wait()
+
+    def entries(self, since, until):
+        """Recorded changes with since < ts <= until, oldest first"""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".ndjson")) \
+            if os.path.isdir(self.directory) else []
+        for name in names:
+            if name[:-len(".ndjson")] < since.date().isoformat():
+                continue
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    moment = datetime.fromisoformat(entry["ts"])
+                    if moment > until:
+                        return
+                    if moment > since:
+                        yield entry
+
+    def prune(self, before):
+        """Remove the files of days before `before` (a date)"""
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.endswith(".ndjson") and name[:-len(".ndjson")] < before.isoformat():
+                os.remove(os.path.join(self.directory, name))
+
+    def _write(self):
+        while True:
+            batch = [self._pending.get()]
+            while True:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            days = {}
+            for item in batch:
+                if isinstance(item, tuple):
+                    days.setdefault(item[0], []).append(item[1])
+            for day, lines in days.items():
+                try:
+                    with open(os.path.join(self.directory, f"{day}.ndjson"), "a", encoding="utf-8") as f:
+                        f.write("\n".join(lines) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                except OSError as e:
+                    print(f"Error writing backup journal: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                return
+
+
+class Backups:
+    def __init__(self, store, root=BACKUP_DIR, pointer_file=POINTER_FILE, attachments_dir=ATTACHMENTS_DIR):
+        self.store = store
+        self.root = root
+        self.snapshots_dir = os.path.join(root, "snapshots")
+        self.pointer_file = pointer_file
+        self.attachments_dir = attachments_dir
+        self.journal = Journal(os.path.join(root, "journal"))
+        self._lock = threading.Lock()     # one backup or restore at a time
+        self._unlinked = None             # cold file -> backup path, while a backup is running
+        self._unlinked_lock = threading.Lock()
+        self._copies = []                 # (open file, backup path) where links are unsupported
+
+    def install(self):
+        """Start journaling the store's changes"""
+        self.journal.start()
+        self.store.backups = self
+
+    def close(self):
+        self.store.backups = None
+        self.journal.stop()
+
+    # -- hooks called by the report store (on the event loop) ----------------
+
+    def record(self, op, report):
+        self.journal.record(op, report)
+
+    def preserve(self, path):
+        """`path` is about to be replaced or removed: link it into the running backup first"""
+        with self._unlinked_lock:
+            target = self._unlinked.pop(path, None) if self._unlinked else None
+            if target:
+                self._capture(path, target)
+
+    # -- backups ---------------------------------------------------------------
+
+    def list(self):
+        """Complete backups, oldest first"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        backups = []
+        for name in sorted(os.listdir(self.snapshots_dir)):
+            manifest_path = os.path.join(self.snapshots_dir, name, MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                backups.append(dict(read_json_file(manifest_path, "load_backup_manifest"), name=name))
+        return backups
+
+    def restorable_range(self):
+        backups = self.list()
+        if not backups:
+            return None
+        return {"from": backups[0]["created_at"], "to": datetime.now().isoformat()}
+
+    def due(self):
+        backups = self.list()
+        if not backups:
+            return True
+        age = datetime.now() - datetime.fromisoformat(backups[-1]["created_at"])
+        return age.total_seconds() >= BACKUP_EVERY_HOURS * 3600
+
+    def backup(self, apply, progress=None):
+        """Take a backup. `apply` runs a function on the event loop (``JobContext.apply``)."""
+        with self._lock:
+            manifest = self._finish(*apply(self._begin), progress=progress)
+            self._prune()
+            return manifest
+
+    def _capture(self, path, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            self._copies.append((open(path, 'rb'), target))
+
+    def _begin(self):
+        """Runs on the event loop: fixes the backup's contents without copying anything"""
+        moment = datetime.now()
+        directory = os.path.join(self.snapshots_dir, _dir_name(moment))
+        self._copies = []
+        if os.path.isdir(self.store.reports_dir):
+            for name in os.listdir(self.store.reports_dir):
+                if name.endswith('.json'):
+                    self._capture(os.path.join(self.store.reports_dir, name), os.path.join(directory, "reports", name))
+        if os.path.exists(self.pointer_file):
+            self._capture(self.pointer_file, os.path.join(directory, POINTER_FILE))
+        unlinked = {}
+        if os.path.isdir(self.store.cold_dir):
+            for name in os.listdir(self.store.cold_dir):
+                if name.endswith('.json.gz'):
+                    unlinked[os.path.join(self.store.cold_dir, name)] = os.path.join(directory, "cold_reports", name)
+        with self._unlinked_lock:
+            self._unlinked = unlinked
+        return moment, directory, len(unlinked)
+
+    def _finish(self, moment, directory, cold, progress=None):
+        """Runs in a worker thread: links the rest and writes the manifest"""
+        linked = 0
+        while True:
+            with self._unlinked_lock:
+                if not self._unlinked:
+                    self._unlinked = None
+                    break
+                self._capture(*self._unlinked.popitem())
+            linked += 1
+            if progress and linked % 1000 == 0:
+                progress(linked, cold, "Linking cold reports")
+        for f, target in self._copies:
+            with f, open(target, 'wb') as out:
+                shutil.copyfileobj(f, out)
+        self._copies = []
+
+        attachments = 0
+        for parent, _, names in os.walk(self.attachments_dir):
+            for name in names:
+                path = os.path.join(parent, name)
+                if not name.endswith('.tmp'):
+                    self._capture(path, os.path.join(directory, "attachments",
+                                                     os.path.relpath(path, self.attachments_dir)))
+                    attachments += 1
+        for f, target in self._copies:
+            with f, open(target, 'wb') as out:
+                shutil.copyfileobj(f, out)
+        self._copies = []
+
+        os.makedirs(directory, exist_ok=True)
+        manifest = {"created_at": moment.isoformat(timespec='microseconds'), "cold_reports": cold,
+                    "attachments": attachments}
+        write_json_file(os.path.join(directory, MANIFEST_FILE), manifest, "save_backup_manifest")
+        return dict(manifest, name=os.path.basename(directory))
+
+    def _prune(self):
+        backups = self.list()
+        complete = {b["name"] for b in backups}
+        for name in os.listdir(self.snapshots_dir):
+            if name not in complete:  # interrupted; no backup runs while we hold the lock
+                shutil.rmtree(os.path.join(self.snapshots_dir, name), ignore_errors=True)
+        for backup in backups[:-KEEP] if KEEP else []:
+            shutil.rmtree(os.path.join(self.snapshots_dir, backup["name"]), ignore_errors=True)
+        kept = backups[-KEEP:] if KEEP else backups
+        if kept:
+            self.journal.prune(datetime.fromisoformat(kept[0]["created_at"]).date())
+
+    # -- restore ---------------------------------------------------------------
+
+    def restore(self, apply, timestamp, progress=None):
+        """Replace the live reports with their state at `timestamp`"""
+        target = parse_timestamp(timestamp)
+        if target > datetime.now():
+            raise RestoreError("Cannot restore to a time in the future")
+        with self._lock:
+            self.journal.flush()
+            base = None
+            for backup in self.list():
+                if datetime.fromisoformat(backup["created_at"]) <= target:
+                    base = backup
+            if base is None:
+                raise RestoreError(f"No backup was taken at or before {timestamp}")
+            before = self._finish(*apply(self._begin), progress=progress)
+
+            # Rebuild the data in a staging directory next to the live one, so
+            # that moving it into place is a rename
+            work = os.path.join(os.path.dirname(os.path.abspath(self.store.reports_dir)),
+                                f".restore-{_dir_name(datetime.now())}")
+            source = os.path.join(self.snapshots_dir, base["name"])
+            reports, replayed = self._replay(source, datetime.fromisoformat(base["created_at"]), target)
+            if progress:
+                progress(0, len(reports), "Writing restored reports")
+            staged = report_store.ReportStore(os.path.join(work, "reports"), os.path.join(work, "cold_reports"),
+                                              os.path.join(work, report_store.LEGACY_REPORTS_FILE))
+            os.makedirs(staged.reports_dir, exist_ok=True)
+            staged.save({"reports": reports})
+            staged.write_snapshot()
+            pointer_path = os.path.join(source, POINTER_FILE)
+            pointer = read_json_file(pointer_path, "load_landfill_data") if os.path.exists(pointer_path) else None
+            restored_attachments = self._restore_attachments(source)
+
+            def swap():
+                replaced = os.path.join(work, "replaced")
+                os.makedirs(replaced, exist_ok=True)
+                for live, new in ((self.store.reports_dir, staged.reports_dir), (self.store.cold_dir, staged.cold_dir)):
+                    if os.path.exists(live):
+                        os.replace(live, os.path.join(replaced, os.path.basename(live)))
+                    if os.path.exists(new):
+                        os.replace(new, live)
+                if pointer is not None:
+                    write_json_file(self.pointer_file, pointer, "save_landfill_data")
+                self.store.reset()
+                return self._begin()
+
+            after = self._finish(*apply(swap), progress=progress)
+            shutil.rmtree(work, ignore_errors=True)
+            self._prune()
+        return {"restored_to": target.isoformat(), "from_backup": base["name"], "reports": len(reports),
+                "journal_entries_replayed": replayed, "attachments_restored": restored_attachments,
+                "backup_before_restore": before["name"], "backup_after_restore": after["name"]}
+
+    def _replay(self, source, since, until):
+        """The backup's reports with the journal applied up to `until`"""
+        backup = report_store.ReportStore(os.path.join(source, "reports"), os.path.join(source, "cold_reports"),
+                                          os.path.join(source, report_store.LEGACY_REPORTS_FILE))
+        reports = {r['id']: r for r in backup.iter_full(backup.load()['reports']) if r.get('id')}
+        replayed = 0
+        for entry in self.journal.entries(since, until):
+            if entry["op"] == "put":
+                reports[entry["id"]] = entry["report"]
+            else:
+                reports.pop(entry["id"], None)
+            replayed += 1
+        return list(reports.values()), replayed
+
+    def _restore_attachments(self, source):
+        """Copy back attachments that have since been removed; existing files are left alone"""
+        source = os.path.join(source, "attachments")
+        restored = 0
+        for parent, _, names in os.walk(source):
+            for name in names:
+                path = os.path.join(parent, name)
+                target = os.path.join(self.attachments_dir, os.path.relpath(path, source))
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copy2(path, target)
+                    restored += 1
+        return restored
@@ -0,0 +1 @@
+"""Benchmarks and synthetic data for the Preferio API (see run.py and dataset.py)."""
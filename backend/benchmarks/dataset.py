@@ -0,0 +1,216 @@
+"""Synthetic dataset generator for the Preferio API benchmarks.
+
+Generates ``all_reports.json`` and ``landfill_data.json`` files shaped like
+the P7922 sample report: Thai company names, half-month periods, GCV and
+fixed-price rows with consistent amount/VAT/total arithmetic, and audit
+trails of configurable length.
+
+Usage (from the backend directory)::
+
+    python -m benchmarks.dataset --reports 10000 --rows-max 200 --out /tmp/preferio-data
+"""
+import argparse
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+
+VAT_RATE = 0.07
+
+COMPANIES = [
+    ("company_001", "บจก. พรีเฟอริโอ้ เทรด"),
+    ("company_002", "บจก. สยาม เอ็นเนอร์ยี่ รีไซเคิล"),
+    ("company_003", "บริษัท ทีพีไอ โพลีน เพาเวอร์ จำกัด (มหาชน)"),
+    ("company_004", "หจก. สระบุรี เวสต์ แมเนจเมนท์"),
+    ("company_005", "บจก. กรีน ฟิวเอล ซัพพลาย"),
+    ("company_006", "บจก. ไทย อินดัสเทรียล เวสต์"),
+    ("company_007", "บจก. อีสเทิร์น ไบโอแมส"),
+    ("company_008", "บจก. เชียงใหม่ คลีน เอ็นเนอร์ยี่"),
+]
+STATUSES = ["draft"] * 6 + ["locked", "published", "published", "archived"]
+USERS = ["system", "somchai", "malee", "anan", "accounting", "A/C Saraburi"]
+ACTIONS = ["updated", "updated", "updated", "locked", "unlocked", "published", "attachment_uploaded"]
+REMARKS = ["", "", "", "เหมาจ่าย 100 บาท", "ปรับราคาตาม GCV", "รอตรวจสอบ", "ค่าขนส่งเพิ่มเติม"]
+
+
+def half_month_periods(start_year=2021):
+    """Yield (start_date, end_date, period) for consecutive half-month periods"""
+    year, month = start_year, 1
+    while True:
+        first = date(year, month, 1)
+        next_month = date(year + (month == 12), month % 12 + 1, 1)
+        last = next_month - timedelta(days=1)
+        yield first, date(year, month, 15), f"1-15/{month:02d}/{year}"
+        yield date(year, month, 16), last, f"16-{last.day}/{month:02d}/{year}"
+        year, month = next_month.year, next_month.month
+
+
+def make_row(rng, row_id):
+    ton = round(rng.uniform(20, 2000), 2)
+    receive_ton = round(ton * rng.uniform(1.0, 1.2), 2) if rng.random() < 0.7 else None
+    if rng.random() < 0.8:
+        gcv = round(rng.uniform(2000, 3600), 2)
+        multi = rng.choice([0.12, 0.15, 0.18])
+        price = rng.choice([150.0, 200.0, 250.0])
+        baht_per_ton = round(gcv * multi + price, 2)
+        pricing_type = "gcv"
+    else:
+        gcv = multi = price = None
+        baht_per_ton = rng.choice([80.0, 100.0, 120.0])
+        pricing_type = "fixed"
+    amount = round(ton * baht_per_ton, 2)
+    vat = round(amount * VAT_RATE, 2)
+    return {
+        "id": row_id,
+        "source": "manual",
+        "ocr_confidence": None,
+        "receive_ton": receive_ton,
+        "ton": ton,
+        "total_ton": ton,
+        "pricing_type": pricing_type,
+        "gcv": gcv,
+        "multi": multi,
+        "price": price,
+        "baht_per_ton": baht_per_ton,
+        "amount": amount,
+        "vat": vat,
+        "total": round(amount + vat, 2),
+        "remark": rng.choice(REMARKS),
+        "needs_review": False,
+        "verified_by": None,
+    }
+
+
+def totals_for(rows):
+    return {
+        "receive_ton": round(sum(r["receive_ton"] or 0 for r in rows), 2),
+        "ton": round(sum(r["ton"] for r in rows), 2),
+        "total_ton": round(sum(r["total_ton"] for r in rows), 2),
+        "amount": round(sum(r["amount"] for r in rows), 2),
+        "vat": round(sum(r["vat"] for r in rows), 2),
+        "total": round(sum(r["total"] for r in rows), 2),
+    }
+
+
+def make_report(rng, number, period, company, rows_min, rows_max, audit_entries):
+    start, end, period_label = period
+    company_id, company_name = company
+    report_id = f"P{number}"
+    created = datetime.combine(end, datetime.min.time()) + timedelta(days=1, hours=rng.randint(8, 17))
+    rows = [make_row(rng, i) for i in range(1, rng.randint(rows_min, rows_max) + 1)]
+    totals = totals_for(rows)
+
+    audit_trail = [{
+        "id": "audit_1",
+        "action": "created",
+        "user_id": "system",
+        "timestamp": created.isoformat(),
+        "comment": "Initial report creation"
+    }]
+    timestamp = created
+    for i in range(2, audit_entries + 1):
+        timestamp += timedelta(minutes=rng.randint(1, 600))
+        action = rng.choice(ACTIONS)
+        audit_trail.append({
+            "id": f"audit_{i}",
+            "action": action,
+            "user_id": rng.choice(USERS),
+            "timestamp": timestamp.isoformat(),
+            "comment": f"Report {action}, version {i}"
+        })
+
+    title = "TPI POLENE POWER PUBLIC COMPANY LIMITED LANDFILL REPORT"
+    return {
+        "id": report_id,
+        "name": title,
+        "version": audit_entries,
+        "status": rng.choice(STATUSES),
+        "company_id": company_id,
+        "date_range": {
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "period": period_label
+        },
+        "source": {"type": "manual", "file_name": None, "uploaded_at": None, "ocr_confidence": None},
+        "locked_by": None,
+        "locked_at": None,
+        "created_by": "system",
+        "last_modified_by": audit_trail[-1]["user_id"],
+        "created_at": created.isoformat(),
+        "updated_at": timestamp.isoformat(),
+        "audit_trail": audit_trail,
+        "report_info": {
+            "title": title,
+            "company": company_name,
+            "period": period_label,
+            "report_id": report_id,
+            "quota_weight": rng.choice([1200, 1500, 1700, 2000]),
+            "reference": f"00W1W{rng.randint(10000, 99999)}/{rng.randint(1, 24)}",
+            "report_by": "A/C Saraburi",
+            "price_reference": f"H{rng.randint(100000, 999999)}",
+            "adjustment": f"700-527/W{rng.randint(1000, 9999)}"
+        },
+        "data_rows": rows,
+        "totals": totals,
+        "additional_info": {
+            "difference_adjustment": round(totals["total"] * rng.uniform(0.9, 1.1), 2),
+            "adjustment_amount": round(rng.uniform(-100000, 100000), 2)
+        },
+        "attachments": []
+    }
+
+
+def iter_reports(count, rows_min=1, rows_max=100, audit_entries=20, seed=7922):
+    """Yield `count` synthetic reports, ids starting at P7922"""
+    rng = random.Random(seed)
+    periods = half_month_periods()
+    period = next(periods)
+    for i in range(count):
+        company = COMPANIES[i % len(COMPANIES)]
+        if i and i % len(COMPANIES) == 0:
+            period = next(periods)
+        yield make_report(rng, 7922 + i, period, company, rows_min, rows_max,
+                          rng.randint(1, audit_entries))
+
+
+def write_dataset(out_dir, count, rows_min=1, rows_max=100, audit_entries=20, seed=7922):
+    """Write all_reports.json and landfill_data.json into `out_dir`.
+
+    Reports are streamed to disk one at a time, so 100k-report datasets can be
+    generated without holding them all in memory. Returns the first report,
+    which is also written as the active landfill report.
+    """
+    os.makedirs(os.path.join(out_dir, "attachments"), exist_ok=True)
+    first = None
+    with open(os.path.join(out_dir, "all_reports.json"), "w", encoding="utf-8") as f:
+        f.write('{\n  "reports": [\n')
+        for i, report in enumerate(iter_reports(count, rows_min, rows_max, audit_entries, seed)):
+            if first is None:
+                first = report
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(report, ensure_ascii=False, indent=2))
+        f.write("\n  ]\n}\n")
+
+    with open(os.path.join(out_dir, "landfill_data.json"), "w", encoding="utf-8") as f:
+        json.dump(first or {}, f, ensure_ascii=False, indent=2)
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Preferio dataset")
+    parser.add_argument("--out", required=True, help="Directory to write the dataset into")
+    parser.add_argument("--reports", type=int, default=1000)
+    parser.add_argument("--rows-min", type=int, default=1)
+    parser.add_argument("--rows-max", type=int, default=100)
+    parser.add_argument("--audit-entries", type=int, default=20, help="Maximum audit trail length")
+    parser.add_argument("--seed", type=int, default=7922)
+    args = parser.parse_args()
+
+    write_dataset(args.out, args.reports, args.rows_min, args.rows_max, args.audit_entries, args.seed)
+    size = os.path.getsize(os.path.join(args.out, "all_reports.json"))
+    print(f"Wrote {args.reports} reports ({size / 1024 / 1024:.1f} MiB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Benchmark the Preferio API in-process.
+
+Generates a synthetic dataset in a temporary directory, drives ``main.app``
+through httpx's ASGI transport (no server or network involved) and reports
+throughput and latency percentiles per scenario. Results are written as JSON
+so two runs can be compared.
+
+Usage (from the backend directory)::
+
+    python -m benchmarks.run --reports 1000 --output bench.json
+    python -m benchmarks.run --reports 1000 --output after.json --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.dataset import COMPANIES, make_row, write_dataset  # noqa: E402
+
+PRESETS = {
+    "small": {"reports": 1000, "rows_min": 1, "rows_max": 50, "audit_entries": 20},
+    "medium": {"reports": 10000, "rows_min": 1, "rows_max": 200, "audit_entries": 50},
+    "large": {"reports": 100000, "rows_min": 1, "rows_max": 1000, "audit_entries": 200},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    ms = [s * 1000 for s in latencies]
+    return {
+        "iterations": len(ms),
+        "throughput_rps": round(len(ms) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "min_ms": round(min(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+class Scenarios:
+    """Request factories for each benchmarked operation"""
+
+    def __init__(self, client, first_report, report_ids, seed):
+        self.client = client
+        self.first_report = first_report
+        self.report_ids = report_ids
+        self.rng = random.Random(seed)
+        self.counter = 0
+        self.row_ids = []
+        self.active_report = None
+        self.locked = False
+
+    def next_report_id(self):
+        self.counter += 1
+        return self.report_ids[self.counter % len(self.report_ids)]
+
+    async def list(self):
+        return await self.client.get("/all-reports")
+
+    async def filter(self):
+        company_id = COMPANIES[self.counter % len(COMPANIES)][0]
+        self.counter += 1
+        return await self.client.get("/landfill-reports", params={"company_id": company_id, "status": "draft"})
+
+    async def search(self):
+        company = COMPANIES[self.counter % len(COMPANIES)][1]
+        self.counter += 1
+        return await self.client.get("/landfill-reports/search/query", params={"company": company})
+
+    async def get(self):
+        return await self.client.get(f"/all-reports/{self.next_report_id()}")
+
+    async def row_add(self):
+        row = make_row(self.rng, None)
+        row.pop("id")
+        response = await self.client.post("/landfill-report/row", json=row)
+        row_id = response.json().get("row", {}).get("id")
+        if row_id is not None:
+            self.row_ids.append(row_id)
+        return response
+
+    async def row_update(self):
+        row_id = self.row_ids[self.counter % len(self.row_ids)]
+        self.counter += 1
+        row = make_row(self.rng, row_id)
+        return await self.client.put(f"/landfill-report/row/{row_id}", json=row)
+
+    async def row_delete(self):
+        return await self.client.delete(f"/landfill-report/row/{self.row_ids.pop()}")
+
+    async def save(self):
+        if self.active_report is None:
+            self.active_report = (await self.client.get("/landfill-report")).json()
+        return await self.client.put("/landfill-report", json=self.active_report)
+
+    async def save_versioned(self):
+        report_id = self.first_report["id"]
+        self.counter += 1
+        if not self.locked:
+            await self.client.post(f"/landfill-reports/{report_id}/lock", params={"user_id": "bench"})
+            self.locked = True
+        return await self.client.post(
+            f"/landfill-reports/{report_id}/save",
+            params={"user_id": "bench"},
+            json={"additional_info": {"difference_adjustment": self.counter, "adjustment_amount": 0}},
+        )
+
+    async def upload(self):
+        files = {"attachment_1": ("statement.pdf", b"%PDF-1.4\n" + b"0" * 64 * 1024, "application/pdf")}
+        return await self.client.post(
+            f"/landfill-reports/{self.next_report_id()}/attachments",
+            data={"user_id": "bench"},
+            files=files,
+        )
+
+
+# Order matters: rows are added before they are updated and deleted
+SCENARIOS = ["list", "filter", "search", "get", "row_add", "row_update", "row_delete",
+             "save", "save_versioned", "upload"]
+
+
+async def run_scenarios(app, first_report, report_ids, iterations, warmup, selected, seed):
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        scenarios = Scenarios(client, first_report, report_ids, seed)
+        for name in SCENARIOS:
+            if name not in selected:
+                continue
+            call = getattr(scenarios, name)
+            # row_add must leave enough rows behind for update and delete
+            runs = iterations + warmup
+            if name == "row_add":
+                runs = 2 * (iterations + warmup)
+            latencies = []
+            errors = 0
+            started = None
+            for i in range(runs):
+                if i == warmup:
+                    started = time.perf_counter()
+                t0 = time.perf_counter()
+                response = await call()
+                latency = time.perf_counter() - t0
+                if response.status_code >= 400 or "error" in _json_or_empty(response):
+                    errors += 1
+                if i >= warmup:
+                    latencies.append(latency)
+            elapsed = time.perf_counter() - started if started else 0
+            results[name] = dict(summarize(latencies, elapsed), errors=errors)
+            print(f"{name:15s} {results[name]['throughput_rps']:>10} req/s  "
+                  f"p50 {results[name]['p50_ms']:>9.3f} ms  p99 {results[name]['p99_ms']:>9.3f} ms"
+                  + (f"  errors {errors}" if errors else ""))
+    return results
+
+
+def _json_or_empty(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    """Print the p50/p99 change of each scenario against a previous run"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit') or 'unknown commit'}):")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("p50_ms", "p99_ms", "throughput_rps"):
+            if before.get(key):
+                changes.append(f"{key} {((result[key] / before[key]) - 1) * 100:+.1f}%")
+        print(f"  {name:15s} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Preferio API in-process")
+    parser.add_argument("--preset", choices=sorted(PRESETS))
+    parser.add_argument("--reports", type=int)
+    parser.add_argument("--rows-min", type=int)
+    parser.add_argument("--rows-max", type=int)
+    parser.add_argument("--audit-entries", type=int)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="Comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=7922)
+    parser.add_argument("--data-dir", help="Use (and keep) this directory instead of a temporary one")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    dataset = dict(PRESETS[args.preset or "small"])
+    for key in ("reports", "rows_min", "rows_max", "audit_entries"):
+        if getattr(args, key) is not None:
+            dataset[key] = getattr(args, key)
+    selected = {s.strip() for s in args.scenarios.split(",") if s.strip()}
+    output = os.path.abspath(args.output)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="preferio-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    print(f"Generating {dataset['reports']} reports in {data_dir} ...")
+    t0 = time.perf_counter()
+    first = write_dataset(data_dir, dataset["reports"], dataset["rows_min"], dataset["rows_max"],
+                          dataset["audit_entries"], args.seed)
+    generate_seconds = time.perf_counter() - t0
+    # Measured now: the API splits all_reports.json into per-company shards on first load
+    dataset_bytes = os.path.getsize(os.path.join(data_dir, "all_reports.json"))
+    report_ids = [f"P{7922 + i}" for i in range(dataset["reports"])]
+
+    # main.py resolves its data files relative to the working directory
+    os.chdir(data_dir)
+    # The upload scenario times the upload itself. Its payloads are not real
+    # PDFs, so OCR jobs would only fail, and they would load the worker pool.
+    os.environ.setdefault("PREFERIO_OCR_ON_UPLOAD", "0")
+    import main as api
+
+    results = asyncio.run(run_scenarios(api.app, first, report_ids, args.iterations, args.warmup,
+                                        selected, args.seed))
+    current = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": dict(dataset, seed=args.seed, bytes=dataset_bytes),
+            "generate_seconds": round(generate_seconds, 3),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if not args.data_dir:
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.compare:
+        compare(current, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Response compression for the Preferio API.
+
+Negotiates gzip (and Brotli when the ``brotli`` package is installed) from
+the request's Accept-Encoding header. Small responses are sent as-is. Complete
+responses that carry an ETag are cached in compressed form, so a report that
+has not changed is not recompressed on every request.
+"""
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def parse_accept_encoding(header):
+    """Return {coding: q} from an Accept-Encoding header value"""
+    codings = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(header, available):
+    """Pick the best content coding from `available` (in server preference order)"""
+    codings = parse_accept_encoding(header or "")
+    wildcard = codings.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressedBodyCache:
+    """Small LRU of compressed bodies, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses JSON/text responses"""
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=5,
+                 cache_max_bytes=32 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.available = ("br", "gzip") if brotli is not None else ("gzip",)
+        self.cache = CompressedBodyCache(cache_max_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept, self.available)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(self, scope, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def compress(self, encoding, body):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def compressor(self, encoding):
+        if encoding == "br":
+            return _BrotliStream(self.brotli_quality)
+        return _GzipStream(self.gzip_level)
+
+
+class _CompressingResponder:
+    """Wraps `send` for one request and compresses the response body"""
+
+    def __init__(self, middleware, scope, encoding, send):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self._send = send
+        self.start_message = None
+        self.passthrough = False
+        self.stream = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message.get("headers", [])))
+            self.start_message = message
+            if not self._should_compress(message):
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.stream is not None:
+            chunk = self.stream.compress(body)
+            if not more_body:
+                chunk += self.stream.flush()
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = _MutableHeaders(self.start_message["headers"])
+
+        if not more_body:
+            # Complete body in a single message: honour the size threshold
+            # and serve repeat ETag-tagged responses from the cache.
+            if len(body) < self.middleware.minimum_size:
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            cache_key = self._cache_key(headers)
+            compressed = self.middleware.cache.get(cache_key) if cache_key else None
+            if compressed is None:
+                compressed = self.middleware.compress(self.encoding, body)
+                if cache_key:
+                    self.middleware.cache.put(cache_key, compressed)
+
+            headers.set("content-encoding", self.encoding)
+            headers.set("content-length", str(len(compressed)))
+            headers.add_vary("Accept-Encoding")
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": compressed})
+            return
+
+        # Streaming response: compress chunk by chunk, never cached.
+        self.stream = self.middleware.compressor(self.encoding)
+        headers.set("content-encoding", self.encoding)
+        headers.remove("content-length")
+        headers.add_vary("Accept-Encoding")
+        await self._send(self.start_message)
+        await self._send({"type": "http.response.body", "body": self.stream.compress(body), "more_body": True})
+
+    def _should_compress(self, message):
+        if self.scope.get("method") == "HEAD" or message["status"] in (204, 304):
+            return False
+        headers = _MutableHeaders(message["headers"])
+        if headers.get("content-encoding"):
+            return False
+        content_type = headers.get("content-type") or ""
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _cache_key(self, headers):
+        etag = headers.get("etag")
+        if not etag or "no-store" in (headers.get("cache-control") or ""):
+            return None
+        return (
+            self.scope.get("path"),
+            self.scope.get("query_string", b""),
+            etag,
+            self.encoding,
+        )
+
+
+class _MutableHeaders:
+    """Edits a raw ASGI header list in place"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def get(self, name):
+        key = name.encode("latin-1")
+        for k, v in self.raw:
+            if k.lower() == key:
+                return v.decode("latin-1")
+        return None
+
+    def remove(self, name):
+        key = name.encode("latin-1")
+        self.raw[:] = [(k, v) for k, v in self.raw if k.lower() != key]
+
+    def set(self, name, value):
+        self.remove(name)
+        self.raw.append((name.encode("latin-1"), value.encode("latin-1")))
+
+    def add_vary(self, value):
+        vary = self.get("vary")
+        if vary and value.lower() in vary.lower():
+            return
+        self.set("vary", f"{vary}, {value}" if vary else value)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH) if data else b""
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._obj.process(data) + self._obj.flush() if data else b""
+
+    def flush(self):
+        return self._obj.finish()
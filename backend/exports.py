@@ -0,0 +1,91 @@
+"""Row-level spreadsheet exports across many reports.
+
+Every ``data_rows`` entry becomes one spreadsheet row, prefixed with its
+report's metadata (report_id, company, period, status). CSV is generated as a
+stream of small chunks. XLSX is written with openpyxl's write-only workbook,
+which spills rows to disk as they are appended. Memory use is therefore the
+same whether one report or a year of them is exported.
+"""
+import csv
+import io
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX export is unavailable without openpyxl
+    Workbook = None
+
+REPORT_COLUMNS = ["report_id", "company_id", "company", "period", "start_date", "end_date", "status", "version"]
+ROW_COLUMNS = ["row_id", "source", "ocr_confidence", "receive_ton", "ton", "total_ton", "pricing_type",
+               "gcv", "multi", "price", "baht_per_ton", "amount", "vat", "total", "remark",
+               "needs_review", "verified_by"]
+COLUMNS = REPORT_COLUMNS + ROW_COLUMNS
+
+CSV_CHUNK_ROWS = 500
+
+
+def iter_rows(reports):
+    """Yield one list of cell values per data row of every report"""
+    for report in reports:
+        info = report.get('report_info', {})
+        date_range = report.get('date_range', {})
+        prefix = [
+            report.get('id'),
+            report.get('company_id'),
+            info.get('company'),
+            info.get('period') or date_range.get('period'),
+            date_range.get('start_date'),
+            date_range.get('end_date'),
+            report.get('status'),
+            report.get('version'),
+        ]
+        for row in report.get('data_rows', []):
+            yield prefix + [row.get('id')] + [row.get(column) for column in ROW_COLUMNS[1:]]
+
+
+def iter_csv(reports):
+    """Yield UTF-8 CSV chunks. A BOM is included so Excel shows Thai text correctly."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield "\ufeff" + buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for values in iter_rows(reports):
+        writer.writerow(["" if v is None else v for v in values])
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def write_csv(reports, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for chunk in iter_csv(reports):
+            f.write(chunk)
+
+
+def write_xlsx(reports, path):
+    """Write an XLSX file in write-only (streaming) mode; returns the row count"""
+    if Workbook is None:
+        raise RuntimeError("openpyxl is not installed; XLSX export is unavailable")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("data_rows")
+    sheet.append(COLUMNS)
+    count = 0
+    for values in iter_rows(reports):
+        sheet.append(values)
+        count += 1
+    workbook.save(path)
+    return count
+
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", write_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+}
@@ -0,0 +1,301 @@
+"""In-process background job queue for the Preferio API.
+
+Heavy operations (exports, bulk recalculations, OCR, large imports) are
+submitted as jobs and run on a bounded pool of worker threads instead of
+inside the request. Jobs have a priority (higher runs first), report progress,
+can be cancelled, and are persisted to ``jobs.json``. Queued and interrupted
+jobs are picked up again after a restart.
+
+Handlers are plain functions registered per job type::
+
+    @jobs.handler("recalculate_totals")
+    def recalculate(ctx, params):
+        ctx.progress(0, total)
+        ...
+        ctx.check_cancelled()
+        ctx.apply(save_changes, changes)   # runs on the API event loop
+        return {"updated": n}
+
+``ctx.apply`` runs a function on the API's event loop and waits for it. The
+report store is only ever modified from the event loop, so handlers that
+write to it need no extra locking.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+JOBS_FILE = os.getenv("PREFERIO_JOBS_FILE", "jobs.json")
+MAX_WORKERS = int(os.getenv("PREFERIO_JOB_WORKERS", "2"))
+MAX_QUEUED = int(os.getenv("PREFERIO_MAX_QUEUED_JOBS", "1000"))
+MAX_FINISHED = int(os.getenv("PREFERIO_MAX_FINISHED_JOBS", "500"))
+PROGRESS_PERSIST_INTERVAL = 1.0
+
+FINISHED = ("completed", "failed", "cancelled")
+
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+def handler(job_type):
+    """Register a function as the handler for `job_type`"""
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+
+def registered_types():
+    return sorted(_handlers)
+
+
+class JobContext:
+    """Passed to handlers to report progress, check cancellation and apply writes"""
+
+    def __init__(self, queue, job):
+        self._queue = queue
+        self.job = job
+
+    @property
+    def cancelled(self):
+        return self.job["cancel_requested"]
+
+    def check_cancelled(self):
+        if self.job["cancel_requested"]:
+            raise JobCancelled()
+
+    def progress(self, done, total=None, message=None):
+        self._queue._update_progress(self.job, done, total, message)
+
+    def apply(self, func, *args):
+        """Run `func(*args)` on the API event loop and return its result"""
+        loop = self._queue.loop
+        if loop is None or not loop.is_running():
+            return func(*args)
+
+        async def call():
+            return func(*args)
+
+        return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+
+class JobQueue:
+    def __init__(self, path=JOBS_FILE, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED):
+        self.path = path
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.loop = None
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopping = False
+        self._loaded = False
+        self._last_persist = 0.0
+
+    # -- persistence ---------------------------------------------------------
+
+    def load(self):
+        """Load persisted jobs; queued and interrupted ones are re-queued"""
+        with self._cond:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    saved = json.load(f).get("jobs", [])
+            except (OSError, ValueError) as e:
+                print(f"Error loading jobs: {e}")
+                return
+            for job in saved:
+                self.jobs[job["id"]] = job
+                if job["status"] == "running":
+                    job["status"] = "queued"
+                    job["restarts"] = job.get("restarts", 0) + 1
+                if job["status"] == "queued":
+                    if job["cancel_requested"]:
+                        self._finish(job, "cancelled")
+                    else:
+                        heapq.heappush(self._heap, (-job["priority"], next(self._seq), job["id"]))
+
+    def _persist(self):
+        """Write all jobs atomically; callers hold self._cond"""
+        finished = [j for j in self.jobs.values() if j["status"] in FINISHED]
+        if len(finished) > MAX_FINISHED:
+            finished.sort(key=lambda j: j["finished_at"] or "")
+            for job in finished[:len(finished) - MAX_FINISHED]:
+                del self.jobs[job["id"]]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"jobs": list(self.jobs.values())}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving jobs: {e}")
+        self._last_persist = time.monotonic()
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self, loop=None):
+        """Start the worker threads (idempotent)"""
+        self.load()
+        with self._cond:
+            if loop is not None:
+                self.loop = loop
+            if self._workers:
+                return
+            self._stopping = False
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._work, name=f"preferio-job-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self):
+        """Stop taking new work. Running jobs are re-queued on next start."""
+        with self._cond:
+            self._stopping = True
+            self._persist()
+            self._cond.notify_all()
+        self._workers = []
+
+    # -- public API ----------------------------------------------------------
+
+    def submit(self, job_type, params=None, priority=0, submitted_by="system"):
+        if job_type not in _handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError):
+            raise ValueError(f"Priority must be an integer, got {priority!r}")
+        self.load()
+        with self._cond:
+            queued = sum(1 for j in self.jobs.values() if j["status"] == "queued")
+            if queued >= self.max_queued:
+                raise QueueFull(f"Job queue is full ({queued} queued)")
+            job = {
+                "id": f"job_{uuid.uuid4().hex[:12]}",
+                "type": job_type,
+                "params": params or {},
+                "priority": priority,
+                "status": "queued",
+                "progress": {"done": 0, "total": None, "message": None},
+                "result": None,
+                "error": None,
+                "cancel_requested": False,
+                "submitted_by": submitted_by,
+                "created_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self.jobs[job["id"]] = job
+            heapq.heappush(self._heap, (-job["priority"], next(self._seq), job["id"]))
+            self._persist()
+            self._cond.notify()
+        return dict(job)
+
+    def get(self, job_id):
+        self.load()
+        with self._cond:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, status=None, job_type=None, limit=100, match=None):
+        """Jobs newest first, optionally filtered by status, type or params"""
+        self.load()
+        with self._cond:
+            jobs = [dict(j) for j in self.jobs.values()
+                    if (not status or j["status"] == status)
+                    and (not job_type or j["type"] == job_type)
+                    and (not match or all(j["params"].get(k) == v for k, v in match.items()))]
+        jobs.sort(key=lambda j: j["created_at"], reverse=True)
+        return jobs[:limit]
+
+    def cancel(self, job_id):
+        """Cancel a queued job immediately or ask a running job to stop"""
+        self.load()
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in FINISHED:
+                job["cancel_requested"] = True
+                if job["status"] == "queued":
+                    self._finish(job, "cancelled")
+                self._persist()
+            return dict(job)
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"workers": len(self._workers), "counts": counts}
+
+    # -- internals -----------------------------------------------------------
+
+    def _finish(self, job, status, result=None, error=None):
+        job["status"] = status
+        job["result"] = result
+        job["error"] = error
+        job["finished_at"] = datetime.now().isoformat()
+
+    def _update_progress(self, job, done, total, message):
+        with self._cond:
+            job["progress"] = {
+                "done": done,
+                "total": total if total is not None else job["progress"]["total"],
+                "message": message,
+            }
+            if time.monotonic() - self._last_persist >= PROGRESS_PERSIST_INTERVAL:
+                self._persist()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                while self._heap:
+                    _, _, job_id = heapq.heappop(self._heap)
+                    job = self.jobs.get(job_id)
+                    if job and job["status"] == "queued":
+                        job["status"] = "running"
+                        job["started_at"] = datetime.now().isoformat()
+                        self._persist()
+                        return job
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            ctx = JobContext(self, job)
+            try:
+                result = _handlers[job["type"]](ctx, job["params"])
+                outcome = ("cancelled", None, None) if job["cancel_requested"] else ("completed", result, None)
+            except JobCancelled:
+                outcome = ("cancelled", None, None)
+            except Exception as e:
+                print(f"Job {job['id']} ({job['type']}) failed: {e}")
+                outcome = ("failed", None, str(e))
+            with self._cond:
+                self._finish(job, *outcome)
+                self._persist()
+
+
+queue = JobQueue()
@@ -0,0 +1,235 @@
+"""In-place JSON Patch (RFC 6902) and JSON Merge Patch (RFC 7396).
+
+Patches are applied directly to the target document, so the cost of an edit
+depends on the size of the edit, not the size of the report. Both kinds are
+atomic: every change records how to undo itself, and if a later one fails
+the document is rolled back before the error is raised. Callers that
+validate the result pass an ``undo`` list to keep those steps, and call
+``rollback(undo)`` if validation fails.
+"""
+import copy
+
+MISSING = object()
+
+
+class PatchError(ValueError):
+    pass
+
+
+class PatchConflict(PatchError):
+    """A ``test`` operation did not match"""
+
+
+def parse_pointer(pointer):
+    """Split an RFC 6901 JSON Pointer into unescaped reference tokens"""
+    if pointer == "":
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _array_index(container, token, allow_end=False):
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document, tokens):
+    target = document
+    for token in tokens:
+        if isinstance(target, dict):
+            if token not in target:
+                raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_array_index(target, token)]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return target
+
+
+def _parent(document, tokens):
+    if not tokens:
+        raise PatchError("Operations on the whole document are not supported")
+    return _resolve(document, tokens[:-1]), tokens[-1]
+
+
+def _add(document, tokens, value, undo):
+    parent, key = _parent(document, tokens)
+    if isinstance(parent, dict):
+        old = parent.get(key, MISSING)
+        parent[key] = value
+        undo.append(lambda: parent.__setitem__(key, old) if old is not MISSING else parent.pop(key))
+    elif isinstance(parent, list):
+        index = _array_index(parent, key, allow_end=True)
+        parent.insert(index, value)
+        undo.append(lambda: parent.pop(index))
+    else:
+        raise PatchError(f"Cannot add to a {type(parent).__name__}")
+
+
+def _remove(document, tokens, undo):
+    parent, key = _parent(document, tokens)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+        old = parent.pop(key)
+        undo.append(lambda: parent.__setitem__(key, old))
+    elif isinstance(parent, list):
+        index = _array_index(parent, key)
+        old = parent.pop(index)
+        undo.append(lambda: parent.insert(index, old))
+    else:
+        raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return old
+
+
+def _replace(document, tokens, value, undo):
+    parent, key = _parent(document, tokens)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    elif isinstance(parent, list):
+        key = _array_index(parent, key)
+    else:
+        raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    old = parent[key]
+    parent[key] = value
+    undo.append(lambda: parent.__setitem__(key, old))
+
+
+def rollback(undo):
+    """Undo the steps recorded by ``apply_patch``/``apply_merge_patch``, newest first"""
+    for step in reversed(undo):
+        step()
+    undo.clear()
+
+
+def apply_patch(document, operations, protected=(), undo=None):
+    """Apply RFC 6902 `operations` to `document` in place.
+
+    Returns the list of changed pointers. Paths under any pointer in
+    `protected` may be tested but not modified. On any failure the document
+    is restored and PatchError (or PatchConflict for a failed ``test``) is
+    raised. On success the undo steps are appended to `undo`, if given.
+    """
+    if not isinstance(operations, list):
+        raise PatchError("A JSON Patch must be an array of operations")
+
+    steps = []
+    changed = []
+
+    def check_writable(pointer):
+        for prefix in protected:
+            if pointer == prefix or pointer.startswith(prefix + "/"):
+                raise PatchError(f"Path is read-only: {pointer}")
+
+    try:
+        for number, operation in enumerate(operations):
+            if not isinstance(operation, dict) or "op" not in operation or "path" not in operation:
+                raise PatchError(f"Operation {number} must have 'op' and 'path'")
+            op, path = operation["op"], operation["path"]
+            tokens = parse_pointer(path)
+
+            if op == "test":
+                if "value" not in operation:
+                    raise PatchError(f"Operation {number} is missing 'value'")
+                if _resolve(document, tokens) != operation["value"]:
+                    raise PatchConflict(f"Test failed at {path}")
+                continue
+
+            check_writable(path)
+            if op == "add":
+                if "value" not in operation:
+                    raise PatchError(f"Operation {number} is missing 'value'")
+                _add(document, tokens, copy.deepcopy(operation["value"]), steps)
+            elif op == "remove":
+                _remove(document, tokens, steps)
+            elif op == "replace":
+                if "value" not in operation:
+                    raise PatchError(f"Operation {number} is missing 'value'")
+                _replace(document, tokens, copy.deepcopy(operation["value"]), steps)
+            elif op in ("move", "copy"):
+                source = operation.get("from")
+                if source is None:
+                    raise PatchError(f"Operation {number} is missing 'from'")
+                source_tokens = parse_pointer(source)
+                if op == "move":
+                    if path.startswith(source + "/"):
+                        raise PatchError(f"Cannot move {source} into itself")
+                    check_writable(source)
+                    value = _remove(document, source_tokens, steps)
+                    changed.append(source)
+                else:
+                    value = copy.deepcopy(_resolve(document, source_tokens))
+                _add(document, tokens, value, steps)
+            else:
+                raise PatchError(f"Unknown operation: {op!r}")
+            changed.append(path)
+    except Exception:
+        rollback(steps)
+        raise
+
+    if undo is not None:
+        undo.extend(steps)
+    return _dedupe(changed)
+
+
+def apply_merge_patch(document, patch, protected=(), undo=None):
+    """Apply an RFC 7396 merge patch to `document` in place; returns changed pointers.
+
+    Like ``apply_patch``, the document is restored on failure and the undo
+    steps are appended to `undo` on success."""
+    steps = []
+    try:
+        changed = _merge(document, patch, protected, "", steps)
+    except Exception:
+        rollback(steps)
+        raise
+    if undo is not None:
+        undo.extend(steps)
+    return changed
+
+
+def _merge(document, patch, protected, prefix, undo):
+    if not isinstance(patch, dict):
+        raise PatchError("A merge patch must be a JSON object")
+    for key in patch:
+        pointer = f"{prefix}/{key.replace('~', '~0').replace('/', '~1')}"
+        if any(pointer == p or pointer.startswith(p + "/") for p in protected):
+            raise PatchError(f"Path is read-only: {pointer}")
+
+    changed = []
+    for key, value in patch.items():
+        pointer = f"{prefix}/{key.replace('~', '~0').replace('/', '~1')}"
+        old = document.get(key, MISSING)
+        if value is None:
+            if old is not MISSING:
+                del document[key]
+                undo.append(lambda key=key, old=old: document.__setitem__(key, old))
+                changed.append(pointer)
+        elif isinstance(value, dict) and isinstance(old, dict):
+            changed.extend(_merge(old, value, protected, pointer, undo))
+        elif old != value:
+            document[key] = _strip_nulls(copy.deepcopy(value))
+            undo.append(lambda key=key, old=old: document.__setitem__(key, old) if old is not MISSING
+                        else document.pop(key))
+            changed.append(pointer)
+    return changed
+
+
+def _strip_nulls(value):
+    if isinstance(value, dict):
+        return {k: _strip_nulls(v) for k, v in value.items() if v is not None}
+    return value
+
+
+def _dedupe(paths):
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
@@ -0,0 +1,247 @@
+"""In-process metrics for the Preferio API, exposed in Prometheus text format.
+
+Only the handful of metric types the API needs are implemented here
+(counters, gauges and fixed-bucket histograms with labels), so no extra
+dependency is required to scrape ``/metrics``.
+"""
+import functools
+import threading
+import time
+
+# Buckets in seconds, from sub-millisecond cache hits up to slow full rewrites
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        for key, (bucket_counts, count, total) in items:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+def render_latest():
+    """Render every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP metrics
+http_request_duration = Histogram(
+    "preferio_http_request_duration_seconds",
+    "Request latency by route template, method and status code",
+    ("method", "route", "status"),
+)
+http_requests_in_progress = Gauge(
+    "preferio_http_requests_in_progress",
+    "Requests currently being handled",
+)
+
+# Admission control metrics (see admission.py)
+admission_in_flight = Gauge(
+    "preferio_admission_in_flight",
+    "Requests admitted and not yet finished, by route class",
+    ("route_class",),
+)
+admission_queue_depth = Gauge(
+    "preferio_admission_queue_depth",
+    "Requests waiting to be admitted, by route class",
+    ("route_class",),
+)
+admission_queue_wait = Histogram(
+    "preferio_admission_queue_wait_seconds",
+    "Time requests spent queued before being admitted",
+    ("route_class",),
+)
+admission_rejected = Counter(
+    "preferio_admission_rejected_total",
+    "Requests turned away with 429 (queue full) or 503 (deadline passed)",
+    ("route_class", "reason"),
+)
+
+# Storage metrics
+storage_operation_duration = Histogram(
+    "preferio_storage_operation_seconds",
+    "Total time spent in a storage helper",
+    ("operation",),
+)
+storage_phase_duration = Histogram(
+    "preferio_storage_phase_seconds",
+    "Time spent per phase (read, parse, dump, write) of a storage helper",
+    ("operation", "phase"),
+)
+storage_bytes_read = Counter(
+    "preferio_storage_bytes_read_total",
+    "Bytes read from disk by storage helpers",
+    ("operation",),
+)
+storage_bytes_written = Counter(
+    "preferio_storage_bytes_written_total",
+    "Bytes written to disk by storage helpers",
+    ("operation",),
+)
+
+
+def record_storage_read(operation, nbytes, read_seconds, parse_seconds):
+    storage_bytes_read.inc(nbytes, operation=operation)
+    storage_phase_duration.observe(read_seconds, operation=operation, phase="read")
+    storage_phase_duration.observe(parse_seconds, operation=operation, phase="parse")
+
+
+def record_storage_write(operation, nbytes, dump_seconds, write_seconds):
+    storage_bytes_written.inc(nbytes, operation=operation)
+    storage_phase_duration.observe(dump_seconds, operation=operation, phase="dump")
+    storage_phase_duration.observe(write_seconds, operation=operation, phase="write")
+
+
+def timed_storage(operation):
+    """Decorator recording the total duration of a storage helper"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                storage_operation_duration.observe(time.perf_counter() - start, operation=operation)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency histograms"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec()
+            # The router stores the matched route in the scope; unmatched
+            # paths share one label so 404 scans cannot blow up cardinality.
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
@@ -0,0 +1,284 @@
+"""Background extraction of landfill rows from uploaded statements.
+
+Extraction runs as an ``ocr`` background job. The job fans out to a process
+pool, one task per page, so multi-page statements are parsed in parallel and
+neither the API's event loop nor the job worker's interpreter does the work.
+Each page is read from the PDF text layer with ``pdfplumber``. When a page
+has no text layer and ``pytesseract`` is installed, the page is rendered and
+OCR'd instead. Attachments that are not PDFs (plain-text exports) are read
+as a single page.
+
+Extracted lines are mapped onto ``LandfillRow`` fields and scored. Scoring
+starts from the extraction confidence and is reduced for every failed
+arithmetic check (amount = total_ton x baht_per_ton, VAT = 7% of amount, and
+so on). Rows below ``REVIEW_THRESHOLD`` are flagged ``needs_review``.
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import pdfplumber
+except ImportError:
+    pdfplumber = None
+
+try:
+    import pytesseract
+except ImportError:  # scanned pages are only OCR'd when tesseract is available
+    pytesseract = None
+
+VAT_RATE = 0.07
+REVIEW_THRESHOLD = float(os.getenv("PREFERIO_OCR_REVIEW_THRESHOLD", "0.85"))
+MAX_WORKERS = int(os.getenv("PREFERIO_OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+TEXT_LAYER_CONFIDENCE = 0.98
+PLAIN_TEXT_CONFIDENCE = 0.95
+
+# A minus sign only counts at the start of a token, and numbers joined by
+# hyphens (dates such as 1-15-09-2025) are not read as numbers at all
+NUMBER_RE = re.compile(r"(?:(?<!\S)-|(?<![\d.-]))(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?![\d.]?\d|-\d)")
+NON_NEGATIVE_FIELDS = ("receive_ton", "ton", "total_ton", "amount")
+
+# Table header aliases (English and Thai) -> LandfillRow field
+HEADER_ALIASES = {
+    "receive_ton": ("receive", "receive ton", "รับเข้า", "น้ำหนักรับ"),
+    "ton": ("ton", "tons", "ตัน", "น้ำหนัก"),
+    "gcv": ("gcv", "ค่าความร้อน"),
+    "multi": ("multi", "multiplier", "ตัวคูณ"),
+    "price": ("price", "ราคา"),
+    "total_ton": ("total ton", "total_ton", "รวมตัน"),
+    "baht_per_ton": ("baht/ton", "baht per ton", "บาท/ตัน"),
+    "amount": ("amount", "จำนวนเงิน"),
+    "vat": ("vat", "ภาษี"),
+    "total": ("total", "รวม", "รวมเงิน"),
+    "remark": ("remark", "remarks", "หมายเหตุ"),
+}
+
+_pool = None
+
+
+# -- Worker side (runs in the process pool) ---------------------------------
+
+def _is_pdf(path):
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def count_pages(path):
+    if not _is_pdf(path):
+        return 1
+    if pdfplumber is None:
+        raise RuntimeError("pdfplumber is not installed; cannot read PDF attachments")
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page(path, page_number):
+    """Return {"page", "method", "confidence", "lines", "tables"} for one page"""
+    if not _is_pdf(path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return {"page": page_number, "method": "text", "confidence": PLAIN_TEXT_CONFIDENCE,
+                    "lines": f.read().splitlines(), "tables": []}
+
+    with pdfplumber.open(path) as pdf:
+        page = pdf.pages[page_number]
+        text = page.extract_text() or ""
+        if text.strip():
+            return {"page": page_number, "method": "text_layer", "confidence": TEXT_LAYER_CONFIDENCE,
+                    "lines": text.splitlines(), "tables": page.extract_tables() or []}
+        if pytesseract is None:
+            return {"page": page_number, "method": "none", "confidence": 0.0, "lines": [], "tables": [],
+                    "warning": "Page has no text layer and pytesseract is not installed"}
+        image = page.to_image(resolution=300).original
+        data = pytesseract.image_to_data(image, lang="tha+eng", output_type=pytesseract.Output.DICT)
+
+    lines, scores, current, current_key = [], [], [], None
+    for word, conf, block, par, line in zip(data["text"], data["conf"], data["block_num"],
+                                            data["par_num"], data["line_num"]):
+        key = (block, par, line)
+        if key != current_key and current:
+            lines.append(" ".join(current))
+            current = []
+        current_key = key
+        if word.strip():
+            current.append(word)
+            if float(conf) >= 0:
+                scores.append(float(conf) / 100)
+    if current:
+        lines.append(" ".join(current))
+    confidence = sum(scores) / len(scores) if scores else 0.0
+    return {"page": page_number, "method": "tesseract", "confidence": confidence, "lines": lines, "tables": []}
+
+
+# -- Mapping extracted text to rows -------------------------------------------
+
+def parse_number(token):
+    try:
+        return float(token.replace(",", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _header_field(cell):
+    label = (cell or "").strip().lower()
+    for field, aliases in HEADER_ALIASES.items():
+        if label in aliases:
+            return field
+    return None
+
+
+def rows_from_table(table):
+    """Map a table with a recognisable header row onto row dicts"""
+    if not table or len(table) < 2:
+        return []
+    columns = [_header_field(cell) for cell in table[0]]
+    if "amount" not in columns and "total" not in columns:
+        return []
+    rows = []
+    for cells in table[1:]:
+        row = {}
+        for field, cell in zip(columns, cells):
+            if field == "remark":
+                row["remark"] = (cell or "").strip()
+            elif field:
+                row[field] = parse_number(cell) if cell else None
+        if row.get("amount") is not None or row.get("total") is not None:
+            rows.append(row)
+    return rows
+
+
+def row_from_line(line):
+    """Map a text line of numbers onto row fields, reading from the right.
+
+    Statements end each row with total_ton, baht/ton, amount, VAT and total.
+    The leading numbers are receive_ton, ton, gcv, multi and price, of which
+    GCV-priced rows have all five and fixed-price rows only the tonnage.
+    """
+    tokens = list(NUMBER_RE.finditer(line))
+    if len(tokens) < 5:
+        return None
+    values = [parse_number(t.group()) for t in tokens]
+    remark = line[tokens[-1].end():].strip()
+    row = dict(zip(("total_ton", "baht_per_ton", "amount", "vat", "total"), values[-5:]))
+    leading = values[:-5]
+    if len(leading) >= 5:
+        leading = leading[-5:]
+        row.update(zip(("receive_ton", "ton", "gcv", "multi", "price"), leading))
+    elif len(leading) == 4:
+        row.update(zip(("ton", "gcv", "multi", "price"), leading))
+    elif len(leading) == 2:
+        row.update(zip(("receive_ton", "ton"), leading))
+    elif len(leading) == 1:
+        row["ton"] = leading[0]
+    if any((row.get(field) or 0) < 0 for field in NON_NEGATIVE_FIELDS):
+        return None
+    row["remark"] = remark
+    return row
+
+
+def _close(a, b, tolerance=0.01):
+    if a is None or b is None:
+        return False
+    return abs(a - b) <= max(abs(b) * tolerance, 0.05)
+
+
+def score_row(row, extraction_confidence):
+    """Confidence in [0, 1] from extraction quality and arithmetic checks"""
+    checks = [
+        _close(row.get("amount"), (row.get("total_ton") or 0) * (row.get("baht_per_ton") or 0)),
+        _close(row.get("vat"), (row.get("amount") or 0) * VAT_RATE),
+        _close(row.get("total"), (row.get("amount") or 0) + (row.get("vat") or 0)),
+    ]
+    if row.get("gcv") is not None:
+        checks.append(_close(row.get("baht_per_ton"),
+                             row["gcv"] * (row.get("multi") or 0) + (row.get("price") or 0)))
+    failed = checks.count(False)
+    return round(max(0.0, extraction_confidence * (1 - 0.25 * failed)), 4)
+
+
+def draft_rows(pages):
+    """Turn extracted pages into LandfillRow-shaped drafts"""
+    drafts = []
+    for page in sorted(pages, key=lambda p: p["page"]):
+        candidates = []
+        for table in page.get("tables", []):
+            candidates.extend(rows_from_table(table))
+        if not candidates:
+            candidates = [row for row in map(row_from_line, page["lines"]) if row]
+        for row in candidates:
+            confidence = score_row(row, page["confidence"])
+            ton = row.get("ton") if row.get("ton") is not None else row.get("total_ton")
+            drafts.append({
+                "id": None,
+                "source": "ocr",
+                "ocr_confidence": confidence,
+                "receive_ton": row.get("receive_ton"),
+                "ton": ton or 0.0,
+                "total_ton": row.get("total_ton") if row.get("total_ton") is not None else (ton or 0.0),
+                "pricing_type": "gcv" if row.get("gcv") is not None else "fixed",
+                "gcv": row.get("gcv"),
+                "multi": row.get("multi"),
+                "price": row.get("price"),
+                "baht_per_ton": row.get("baht_per_ton") or 0.0,
+                "amount": row.get("amount") or 0.0,
+                "vat": row.get("vat") or 0.0,
+                "total": row.get("total") or 0.0,
+                "remark": row.get("remark", ""),
+                "needs_review": confidence < REVIEW_THRESHOLD,
+                "verified_by": None,
+                "page": page["page"] + 1,
+            })
+    return drafts
+
+
+# -- Coordinator side (runs in a job worker thread) ---------------------------
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Not fork: the API process runs uvicorn, job workers and the backup
+        # journal in threads, and forking a threaded process can deadlock
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def extract(path, progress=None, check_cancelled=None):
+    """Extract every page of `path` in parallel and return the drafted rows.
+
+    `progress(done, total)` is called as pages finish. `check_cancelled()` is
+    called between pages and may raise to abandon the remaining pages.
+    """
+    pool = get_pool()
+    total = pool.submit(count_pages, path).result()
+    futures = [pool.submit(extract_page, path, number) for number in range(total)]
+    pages = []
+    try:
+        for future in as_completed(futures):
+            pages.append(future.result())
+            if progress:
+                progress(len(pages), total)
+            if check_cancelled:
+                check_cancelled()
+    finally:
+        for future in futures:
+            future.cancel()
+
+    drafts = draft_rows(pages)
+    summary = {
+        "pages": total,
+        "rows_extracted": len(drafts),
+        "rows_needing_review": sum(1 for d in drafts if d["needs_review"]),
+        "confidence": round(min(d["ocr_confidence"] for d in drafts), 4) if drafts else None,
+    }
+    warnings = sorted({p["warning"] for p in pages if p.get("warning")})
+    if warnings:
+        summary["warnings"] = warnings
+    return drafts, summary
@@ -0,0 +1,236 @@
+"""On-demand request profiling for the Preferio API.
+
+Profiling is off unless ``PREFERIO_PROFILING=1`` is set, in which case
+``main.py`` installs :class:`ProfilingMiddleware`. When the variable is unset
+the middleware is never added, so there is no per-request cost at all.
+
+With profiling enabled a request is profiled when either:
+
+* it sends ``X-Profile: cprofile`` (or ``sample``) together with a valid
+  ``X-Admin-Token``, or
+* its ``METHOD /path`` matches an entry in ``PREFERIO_PROFILE_ROUTES``
+  (comma separated, e.g. ``PUT /landfill-report,POST /landfill-report/row``).
+
+Two modes are available. ``cprofile`` runs the deterministic profiler and
+stores a ``.prof`` file readable with :mod:`pstats` or snakeviz. ``sample``
+samples the event loop thread's stack every millisecond and stores
+collapsed stacks (``.folded``) that flamegraph.pl or speedscope read
+directly. Each profile gets a ``.json`` sidecar used by the admin listing.
+"""
+import cProfile
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+PROFILES_DIR = os.getenv("PREFERIO_PROFILES_DIR", "profiles")
+MAX_PROFILES = int(os.getenv("PREFERIO_MAX_PROFILES", "50"))
+SAMPLE_INTERVAL = float(os.getenv("PREFERIO_PROFILE_SAMPLE_INTERVAL", "0.001"))
+MODES = ("cprofile", "sample")
+
+
+def enabled():
+    return os.getenv("PREFERIO_PROFILING", "").lower() in ("1", "true", "yes")
+
+
+def admin_token_valid(token):
+    """Check an X-Admin-Token value against PREFERIO_ADMIN_TOKEN"""
+    expected = os.getenv("PREFERIO_ADMIN_TOKEN")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token, expected)
+
+
+def configured_routes():
+    routes = set()
+    for entry in os.getenv("PREFERIO_PROFILE_ROUTES", "").split(","):
+        method, _, path = entry.strip().partition(" ")
+        if method and path:
+            routes.add((method.upper(), path.strip()))
+    return routes
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="preferio-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _slug(path):
+    return re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_")[:60] or "root"
+
+
+def save_profile(mode, method, path, status, duration, payload):
+    """Write a profile and its sidecar; returns the profile name"""
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    name = f"{stamp}_{method}_{_slug(path)}"
+    extension = "prof" if mode == "cprofile" else "folded"
+    file_name = f"{name}.{extension}"
+    file_path = os.path.join(PROFILES_DIR, file_name)
+
+    if mode == "cprofile":
+        payload.dump_stats(file_path)
+    else:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(payload.collapsed())
+
+    meta = {
+        "name": name,
+        "mode": mode,
+        "method": method,
+        "path": path,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "file_name": file_name,
+        "size": os.path.getsize(file_path),
+        "created_at": datetime.now().isoformat(),
+    }
+    with open(os.path.join(PROFILES_DIR, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    _prune()
+    return name
+
+
+def _prune():
+    sidecars = sorted(f for f in os.listdir(PROFILES_DIR) if f.endswith(".json"))
+    for sidecar in sidecars[:-MAX_PROFILES]:
+        name = sidecar[:-len(".json")]
+        for extension in (".json", ".prof", ".folded"):
+            try:
+                os.remove(os.path.join(PROFILES_DIR, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=MAX_PROFILES):
+    """Most recent profiles first"""
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    profiles = []
+    for sidecar in sorted((f for f in os.listdir(PROFILES_DIR) if f.endswith(".json")), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(PROFILES_DIR, sidecar), "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def get_profile_meta(name):
+    for profile in list_profiles():
+        if profile["name"] == name:
+            return profile
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests selected by header or config"""
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = configured_routes()
+        # cProfile and the sampler can only watch one request at a time
+        self._busy = threading.Lock()
+
+    def _requested_mode(self, scope):
+        headers = {k: v for k, v in scope.get("headers", []) if k in (b"x-profile", b"x-admin-token")}
+        mode = headers.get(b"x-profile", b"").decode("latin-1").strip().lower()
+        if mode:
+            token = headers.get(b"x-admin-token", b"").decode("latin-1")
+            if admin_token_valid(token):
+                return mode if mode in MODES else "cprofile"
+            return None
+        if (scope.get("method"), scope.get("path")) in self.routes:
+            return "cprofile"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, _with_header(send, b"x-profile-status", b"busy"))
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (b"x-profile-status", b"recorded"),
+                    (b"x-profile-mode", mode.encode("latin-1")),
+                ])
+            await send(message)
+
+        try:
+            if mode == "cprofile":
+                collector = cProfile.Profile()
+                collector.enable()
+            else:
+                collector = StackSampler(threading.get_ident())
+                collector.start()
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                duration = time.perf_counter() - start
+                if mode == "cprofile":
+                    collector.disable()
+                else:
+                    collector.stop()
+                try:
+                    save_profile(mode, scope.get("method", ""), scope.get("path", ""),
+                                 status["code"], duration, collector)
+                except Exception as e:
+                    print(f"Error saving profile for {scope.get('path')}: {e}")
+        finally:
+            self._busy.release()
+
+
+def _with_header(send, name, value):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message.get("headers", [])) + [(name, value)])
+        await send(message)
+    return send_wrapper
@@ -0,0 +1,670 @@
+"""The report store: every report, held in memory and indexed by ID.
+
+Reports are sharded by ``company_id``. Each company's reports live in their
+own file, ``reports/<company_id>.json``, shaped like the old
+``all_reports.json`` (``{"reports": [...]}``). An edit rewrites only the
+shard of the company it belongs to. An ``all_reports.json`` left from before
+sharding is split into shards the first time the store loads, and then
+renamed to ``all_reports.json.pre-sharding``.
+
+Shards are parsed once and then served from memory. A report is found through
+an ID index instead of a scan. Writes go straight to disk. If a shard file
+changes underneath the process (a manual edit or a restore), the next access
+notices the new mtime/size and reloads that shard. Stale shards are reloaded
+in parallel. ``load`` returns every shard's reports merged into one document
+for cross-company queries.
+
+Reports handed out by the store are the live objects, so callers edit them
+in place and then call ``save_report``.
+
+Every file is written to a temporary file and renamed into place, so a
+reader never sees a partly written file and a file, once written, never
+changes. Online backups (backups.py) rely on this; when ``backups`` is set,
+every saved or deleted report is also recorded in its journal.
+
+Startup does not parse the shards. A snapshot of the ID index and a summary
+of every report is kept in ``reports/_index.snapshot`` (marshal, with a
+sha256 checksum). It records each shard file's mtime and size when it was
+taken. ``open`` reads the snapshot and parses only the shards that changed
+since then. Every other shard is read the first time one of its reports is
+needed. Filtering and search run over the summaries, so they only read the
+shards that hold matching reports. The snapshot is rewritten at shutdown and
+after every ``SNAPSHOT_EVERY`` writes. A stale or damaged snapshot is never
+wrong, only slower: it falls back to reading the affected shards.
+
+Storage is tiered. Archived reports, and published reports not updated for
+``COLD_AFTER_DAYS``, are moved to gzip-compressed files under
+``cold_reports/``. In their shard each one is replaced by a small summary
+marked ``"tier": "cold"``. The summary has no rows, attachments or audit
+trail, so listing and filtering still work. ``get`` loads the full report
+from its cold file on demand, and a few recently used cold reports are
+cached. A cold report that is saved goes back to the hot tier, unless it
+still qualifies as cold. The markers (``TIER_FIELDS``) are the store's own:
+they are stripped from every report saved, and a cold summary itself is
+never accepted as a report to save.
+"""
+import gzip
+import hashlib
+import json
+import marshal
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import metrics
+
+REPORTS_DIR = os.getenv("PREFERIO_REPORTS_DIR", "reports")
+LEGACY_REPORTS_FILE = "all_reports.json"
+LOAD_WORKERS = int(os.getenv("PREFERIO_SHARD_LOAD_WORKERS", "8"))
+DEFAULT_SHARD = "_unassigned"
+
+SNAPSHOT_FILE = "_index.snapshot"
+SNAPSHOT_MAGIC = b"PREFERIO-INDEX\x01"
+SNAPSHOT_EVERY = int(os.getenv("PREFERIO_SNAPSHOT_EVERY", "200"))  # writes between snapshots
+
+COLD_DIR = os.getenv("PREFERIO_COLD_DIR", "cold_reports")
+COLD_AFTER_DAYS = int(os.getenv("PREFERIO_COLD_AFTER_DAYS", "365"))  # 0 keeps old reports hot
+COLD_CACHE_SIZE = 32
+
+# Fields copied into the hot-tier summary of a cold report
+SUMMARY_FIELDS = ("id", "name", "version", "status", "company_id", "date_range", "report_info", "totals",
+                  "locked_by", "locked_at", "created_by", "last_modified_by", "created_at", "updated_at")
+
+
+# JSON file helpers (record bytes and read/parse/dump/write time on /metrics)
+def read_json_file(path, operation):
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        raw = f.read()
+    read_done = time.perf_counter()
+    data = json.loads(raw)
+    metrics.record_storage_read(operation, len(raw), read_done - start, time.perf_counter() - read_done)
+    return data
+
+
+def write_json_file(path, data, operation):
+    """Write `path` atomically: a temporary file is renamed over it"""
+    start = time.perf_counter()
+    raw = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    dump_done = time.perf_counter()
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(raw)
+    os.replace(f"{path}.tmp", path)
+    metrics.record_storage_write(operation, len(raw), dump_done - start, time.perf_counter() - dump_done)
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def shard_key(report):
+    """The shard a report belongs to: its company_id, made safe as a file name"""
+    key = re.sub(r'[^A-Za-z0-9_.-]', '_', str(report.get('company_id') or ''))
+    return key.strip('.') or DEFAULT_SHARD
+
+
+TIER_FIELDS = ('tier', 'row_count')
+
+
+def is_cold(report):
+    return report.get('tier') == 'cold'
+
+
+def strip_tier_fields(report):
+    """Remove the store's tier markers from a report that came from a client"""
+    for field in TIER_FIELDS:
+        report.pop(field, None)
+    return report
+
+
+def summarize(report):
+    """The hot-tier stand-in for a cold report"""
+    summary = {field: report[field] for field in SUMMARY_FIELDS if field in report}
+    summary['tier'] = 'cold'
+    summary['row_count'] = len(report.get('data_rows', []))
+    return summary
+
+
+def index_summary(entry):
+    """The snapshot's summary of an index entry (a cold entry already is one)"""
+    return entry if is_cold(entry) else dict(summarize(entry), tier='hot')
+
+
+def should_be_cold(report, now=None):
+    if report.get('locked_by'):
+        return False
+    if report.get('status') == 'archived':
+        return True
+    if report.get('status') != 'published' or not COLD_AFTER_DAYS:
+        return False
+    try:
+        updated = datetime.fromisoformat(report.get('updated_at') or report.get('created_at'))
+    except (TypeError, ValueError):
+        return False
+    return updated.replace(tzinfo=None) < (now or datetime.now()) - timedelta(days=COLD_AFTER_DAYS)
+
+
+class Shard:
+    """One company's reports and the file they are stored in"""
+
+    def __init__(self, key, path):
+        self.key = key
+        self.path = path
+        self.reports = []
+        self.summaries = None  # from the index snapshot, until the shard is read
+        self.lock = threading.Lock()  # held while the file is read or written
+        self._stamp = None
+        self._loaded = False
+
+    def stale(self):
+        return not self._loaded or _file_stamp(self.path) != self._stamp
+
+    def summaries_valid(self):
+        return self.summaries is not None and _file_stamp(self.path) == self._stamp
+
+    def read(self):
+        """Read and parse the shard file; does not touch the store (runs in a thread)"""
+        with self.lock:
+            if not os.path.exists(self.path):
+                return [], None
+            data = read_json_file(self.path, "load_shard")
+            return data.get('reports', []), _file_stamp(self.path)
+
+    def write(self):
+        with self.lock:
+            write_json_file(self.path, {"reports": self.reports}, "save_shard")
+            self._stamp = _file_stamp(self.path)
+            self._loaded = True
+
+
+class ReportStore:
+    def __init__(self, reports_dir=REPORTS_DIR, cold_dir=COLD_DIR, legacy_path=LEGACY_REPORTS_FILE):
+        self.reports_dir = reports_dir
+        self.cold_dir = cold_dir
+        self.legacy_path = legacy_path
+        self.snapshot_path = os.path.join(reports_dir, SNAPSHOT_FILE)
+        self.shards = {}
+        self.index = {}       # report id -> report (or cold summary), for shards that have been read
+        self.shard_of = {}    # report id -> shard key, for every shard
+        self.generation = 0   # bumped on every write; recorded in the snapshot
+        self._merged = None
+        self._dir_stamp = None
+        self._opened = False
+        self._writes_since_snapshot = 0
+        self._cold_cache = OrderedDict()
+        # Set by backups.py: record(op, report) is called for every change and
+        # preserve(path) before a cold file is replaced or removed
+        self.backups = None
+
+    def reset(self):
+        """Forget everything in memory (after files were replaced, e.g. by a restore)"""
+        backups = self.backups
+        self.__init__(self.reports_dir, self.cold_dir, self.legacy_path)
+        self.backups = backups
+
+    # -- loading ---------------------------------------------------------------
+
+    def open(self):
+        """Get ready to serve: read the index snapshot and only the shards it does not cover.
+
+        Returns the number of shards that had to be parsed."""
+        if self._opened:
+            return 0
+        self._opened = True
+        self._scan()
+        snapshot = self.read_snapshot()
+        if snapshot is not None:
+            self.generation = snapshot['generation']
+            for key, entry in snapshot['shards'].items():
+                shard = self.shards.get(key)
+                stamp = tuple(entry['stamp'])
+                if shard is None or shard._loaded or _file_stamp(shard.path) != stamp:
+                    continue
+                shard.summaries = entry['summaries']
+                shard._stamp = stamp
+                for summary in shard.summaries:
+                    self.shard_of[summary['id']] = key
+        unread = [shard for shard in self.shards.values() if not shard.summaries_valid()]
+        self._ensure(unread)
+        return len(unread)
+
+    def load(self):
+        """Every report, merged across shards into one {"reports": [...]} document.
+
+        Reads any shard not read yet or changed on disk. Cold reports appear
+        in it as summaries (see ``is_cold``)."""
+        self._discover()
+        self._ensure(list(self.shards.values()))
+        if self._merged is None:
+            self._merged = {"reports": [r for key in sorted(self.shards) for r in self.shards[key].reports]}
+        return self._merged
+
+    def summaries(self):
+        """A summary of every report (or the report itself where its shard has been read).
+
+        Has the fields filter_reports and search need; unread shards stay unread."""
+        self._discover()
+        self._ensure([shard for shard in self.shards.values() if shard.stale() and not shard.summaries_valid()])
+        result = []
+        for key in sorted(self.shards):
+            shard = self.shards[key]
+            result.extend(shard.reports if shard._loaded else shard.summaries)
+        return result
+
+    def _ensure(self, shards):
+        """Read the given shards if they have not been read or changed on disk (in parallel)"""
+        stale = [shard for shard in shards if shard.stale()]
+        if not stale:
+            return
+        if len(stale) > 1:
+            with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(stale))) as pool:
+                results = list(pool.map(Shard.read, stale))
+        else:
+            results = [stale[0].read()]
+        if any(shard._loaded for shard in stale):
+            self._cold_cache.clear()  # changed outside this process
+        for shard, (reports, stamp) in zip(stale, results):
+            self._install(shard, reports, stamp)
+        self._merged = None
+
+    def _discover(self):
+        if not self._opened:
+            self.open()
+        else:
+            self._scan()
+
+    def _scan(self):
+        """Pick up shard files created outside this process (checked via the directory's mtime)"""
+        if self._dir_stamp is None and os.path.exists(self.legacy_path):
+            self._split_legacy_file()
+        os.makedirs(self.reports_dir, exist_ok=True)
+        stamp = _file_stamp(self.reports_dir)
+        if stamp == self._dir_stamp:
+            return
+        self._dir_stamp = stamp
+        for name in os.listdir(self.reports_dir):
+            if name.endswith('.json'):
+                self._shard(name[:-len('.json')])
+
+    def _install(self, shard, reports, stamp):
+        for report in (shard.reports if shard._loaded else shard.summaries or []):
+            if self.shard_of.get(report.get('id')) == shard.key:
+                self.index.pop(report['id'], None)
+                del self.shard_of[report['id']]
+        shard.reports = reports
+        shard.summaries = None
+        shard._stamp = stamp
+        shard._loaded = True
+        for report in reports:
+            if report.get('id'):
+                self.index[report['id']] = report
+                self.shard_of[report['id']] = shard.key
+
+    def _shard(self, key):
+        shard = self.shards.get(key)
+        if shard is None:
+            shard = self.shards[key] = Shard(key, os.path.join(self.reports_dir, f"{key}.json"))
+            self._merged = None
+        return shard
+
+    def _split_legacy_file(self):
+        """Move an all_reports.json from before sharding into per-company shard files"""
+        os.makedirs(self.reports_dir, exist_ok=True)
+        data = read_json_file(self.legacy_path, "load_all_reports")
+        groups = {}
+        for report in data.get('reports', []):
+            groups.setdefault(shard_key(report), []).append(report)
+        for key, reports in groups.items():
+            shard = self._shard(key)
+            existing, _ = shard.read()
+            shard.reports = existing + reports
+            shard.write()
+        os.replace(self.legacy_path, f"{self.legacy_path}.pre-sharding")
+        self.shards.clear()
+
+    # -- reading ---------------------------------------------------------------
+
+    def get(self, report_id):
+        """The full report, loading it from the cold tier if necessary"""
+        report = self._locate(report_id)
+        if report is not None and is_cold(report):
+            return self._hydrate(report_id)
+        return report
+
+    def entries(self, report_ids):
+        """Index entries (hot reports, cold summaries) for `report_ids`, reading only their shards"""
+        self._discover()
+        self._ensure([self.shards[key] for key in {self.shard_of.get(i) for i in report_ids} if key])
+        return [self.index[i] for i in report_ids if i in self.index]
+
+    def _locate(self, report_id):
+        """The index entry for `report_id`, reading its shard first if needed"""
+        self._discover()
+        key = self.shard_of.get(report_id)
+        if key is not None:
+            self._ensure([self.shards[key]])
+        if report_id not in self.index:
+            # Maybe in a shard that changed on disk since the snapshot (or was just created)
+            self._ensure([s for s in self.shards.values() if s.stale() and not s.summaries_valid()])
+        return self.index.get(report_id)
+
+    def iter_full(self, reports):
+        """Yield full documents for `reports`, reading cold ones without caching them.
+
+        Safe to call from a worker thread: it does not modify the store."""
+        for report in reports:
+            if not is_cold(report):
+                yield report
+                continue
+            try:
+                yield self.read_cold(report['id'])
+            except FileNotFoundError:
+                # Promoted back to the hot tier since `reports` was taken
+                current = self.index.get(report['id'])
+                if current is not None and not is_cold(current):
+                    yield current
+
+    def stamp(self):
+        """(newest mtime_ns, total size) over all shard files, for ETags"""
+        self._discover()
+        stamps = [stamp for stamp in map(_file_stamp, (s.path for s in self.shards.values())) if stamp]
+        return (max((s[0] for s in stamps), default=0), sum(s[1] for s in stamps))
+
+    def stats(self):
+        reports = self.summaries()
+        cold = sum(1 for r in reports if is_cold(r))
+        return {"shards": len(self.shards), "shards_read": sum(1 for s in self.shards.values() if s._loaded),
+                "hot": len(reports) - cold, "cold": cold, "cold_cached": len(self._cold_cache),
+                "generation": self.generation}
+
+    # -- writing ---------------------------------------------------------------
+
+    def save_report(self, report):
+        """Persist `report` after an in-place edit, or add it if it is new.
+
+        Only its shard is rewritten (two shards if its company_id changed)."""
+        self.save_reports([report])
+
+    def add(self, report):
+        """Store a new report; raises ValueError if its ID is already taken"""
+        self._discover()
+        if self._locate(report['id']) is not None:
+            raise ValueError(f"Report {report['id']} already exists")
+        self.save_reports([report])
+
+    def save_reports(self, reports):
+        """Persist edited or new reports with one write per affected shard"""
+        self._discover()
+        touched = {}
+        for report in reports:
+            for shard in self._stage(report):
+                touched[shard.key] = shard
+        try:
+            for shard in touched.values():
+                shard.write()
+        except Exception:
+            # Memory now holds edits the disk does not: go back to what is on disk
+            self._cold_cache.clear()
+            for shard in touched.values():
+                self._install(shard, *shard.read())
+            self._merged = None
+            raise
+        self._written()
+
+    def _stage(self, report):
+        """Put `report` (or its cold summary) in its shard; returns the shards changed"""
+        if is_cold(report):
+            raise ValueError(f"Report {report.get('id')} is a cold-tier summary, not a full report")
+        strip_tier_fields(report)
+        report_id = report['id']
+        entry = self._locate(report_id)
+        old_key = self.shard_of.get(report_id)
+        shard = self._shard(shard_key(report))
+        self._ensure([shard])
+        changed = [shard]
+        self._record("put", report)
+
+        new_entry = report
+        if should_be_cold(report):
+            self.write_cold(report)
+            self._cold_cache[report_id] = report
+            new_entry = summarize(report)
+        elif entry is not None and is_cold(entry):
+            self._drop_cold(report_id)
+
+        if old_key is not None and old_key != shard.key:
+            old_shard = self.shards[old_key]
+            old_shard.reports = [r for r in old_shard.reports if r is not entry]
+            changed.append(old_shard)
+            entry = None
+        if entry is None:
+            shard.reports.append(new_entry)
+        elif entry is not new_entry:
+            shard.reports[self._position(shard, entry)] = new_entry
+        if entry is not new_entry:
+            self._merged = None
+        self.index[report_id] = new_entry
+        self.shard_of[report_id] = shard.key
+        return changed
+
+    def replace(self, report_id, report):
+        """Replace a stored report wholesale; returns False if there is none"""
+        if is_cold(report):
+            raise ValueError(f"Report {report_id} is a cold-tier summary, not a full report")
+        entry = self._locate(report_id)
+        if entry is None:
+            return False
+        shard = self.shards[self.shard_of[report_id]]
+        shard.reports[self._position(shard, entry)] = report
+        self.index[report_id] = report
+        self._merged = None
+        if is_cold(entry):
+            self._drop_cold(report_id)
+        self.save_report(report)
+        return True
+
+    def delete(self, report_id):
+        entry = self._locate(report_id)
+        if entry is None:
+            return False
+        del self.index[report_id]
+        shard = self.shards[self.shard_of.pop(report_id)]
+        shard.reports = [r for r in shard.reports if r is not entry]
+        shard.write()
+        self._record("delete", {"id": report_id})
+        if is_cold(entry):
+            self._drop_cold(report_id)
+        self._merged = None
+        self._written()
+        return True
+
+    def save(self, data=None):
+        """Persist a whole merged document, rewriting every shard.
+
+        Prefer ``save_report``/``save_reports``/``delete``, which only write
+        the shards they touch."""
+        if data is None:
+            data = self.load()
+        previous = dict(self.index)
+        groups = {key: [] for key in self.shards}
+        for report in data.get('reports', []):
+            groups.setdefault(shard_key(report), []).append(report)
+        self.index.clear()
+        self.shard_of.clear()
+        for key, reports in groups.items():
+            shard = self._shard(key)
+            shard.reports = reports
+            for report in reports:
+                # Only journal what changed; unchanged reports are already in the log
+                if report.get('id') and not is_cold(report) and previous.get(report['id']) != report:
+                    self._record("put", report)
+            self._demote_eligible(shard)
+            shard.write()
+            for report in shard.reports:
+                if report.get('id'):
+                    self.index[report['id']] = report
+                    self.shard_of[report['id']] = key
+        self._merged = None
+        # Cold files of reports that were deleted or replaced by a full copy
+        for report_id, report in previous.items():
+            if is_cold(report) and not is_cold(self.index.get(report_id, {})):
+                self._drop_cold(report_id)
+        self._written()
+
+    def tier(self):
+        """Move every report that qualifies into the cold tier; returns how many moved.
+
+        Candidates are found from the summaries, so only their shards are read."""
+        now = datetime.now()
+        candidates = {r['id'] for r in self.summaries() if not is_cold(r) and r.get('id') and should_be_cold(r, now)}
+        shards = [self.shards[key] for key in {self.shard_of[i] for i in candidates if i in self.shard_of}]
+        self._ensure(shards)
+        moved = 0
+        for shard in shards:
+            shard_moved = self._demote_eligible(shard)
+            if shard_moved:
+                shard.write()
+                moved += shard_moved
+        if moved:
+            self._merged = None
+            self._written()
+        return moved
+
+    def _record(self, op, report):
+        if self.backups is not None:
+            self.backups.record(op, report)
+
+    # -- index snapshot --------------------------------------------------------
+
+    def _written(self):
+        self.generation += 1
+        self._writes_since_snapshot += 1
+        if self._writes_since_snapshot >= SNAPSHOT_EVERY:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """Persist the ID index and report summaries, written atomically"""
+        self._discover()
+        shards = {}
+        for key, shard in self.shards.items():
+            if shard._loaded:
+                summaries = [index_summary(r) for r in shard.reports if r.get('id')]
+            elif shard.summaries_valid():
+                summaries = shard.summaries
+            else:
+                continue  # changed on disk and not read yet; the next open() reads it
+            if shard._stamp:
+                shards[key] = {"stamp": list(shard._stamp), "summaries": summaries}
+        start = time.perf_counter()
+        payload = marshal.dumps({"format": 1, "generation": self.generation, "shards": shards})
+        dump_done = time.perf_counter()
+        with open(f"{self.snapshot_path}.tmp", 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + hashlib.sha256(payload).digest() + payload)
+        os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+        metrics.record_storage_write("save_index_snapshot", len(payload), dump_done - start,
+                                     time.perf_counter() - dump_done)
+        self._writes_since_snapshot = 0
+
+    def read_snapshot(self):
+        """The snapshot written by ``write_snapshot``, or None if missing or invalid"""
+        try:
+            start = time.perf_counter()
+            with open(self.snapshot_path, 'rb') as f:
+                raw = f.read()
+            read_done = time.perf_counter()
+        except FileNotFoundError:
+            return None
+        header = len(SNAPSHOT_MAGIC)
+        payload = raw[header + 32:]
+        if raw[:header] != SNAPSHOT_MAGIC or hashlib.sha256(payload).digest() != raw[header:header + 32]:
+            print("Ignoring index snapshot: checksum mismatch")
+            return None
+        try:
+            snapshot = marshal.loads(payload)
+        except (EOFError, ValueError, TypeError) as e:  # e.g. written by another Python version
+            print(f"Ignoring index snapshot: {e}")
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("format") != 1:
+            return None
+        metrics.record_storage_read("load_index_snapshot", len(raw), read_done - start,
+                                    time.perf_counter() - read_done)
+        return snapshot
+
+    # -- cold tier -------------------------------------------------------------
+
+    def cold_path(self, report_id):
+        return os.path.join(self.cold_dir, f"{report_id}.json.gz")
+
+    def read_cold(self, report_id):
+        start = time.perf_counter()
+        with open(self.cold_path(report_id), 'rb') as f:
+            compressed = f.read()
+        read_done = time.perf_counter()
+        report = json.loads(gzip.decompress(compressed))
+        metrics.record_storage_read("load_cold_report", len(compressed), read_done - start,
+                                    time.perf_counter() - read_done)
+        return report
+
+    def write_cold(self, report):
+        """Write one report's cold file atomically (temp file, then rename)"""
+        os.makedirs(self.cold_dir, exist_ok=True)
+        start = time.perf_counter()
+        compressed = gzip.compress(json.dumps(report, ensure_ascii=False).encode('utf-8'), compresslevel=6)
+        dump_done = time.perf_counter()
+        path = self.cold_path(report['id'])
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(compressed)
+        if self.backups is not None:
+            self.backups.preserve(path)
+        os.replace(f"{path}.tmp", path)
+        metrics.record_storage_write("save_cold_report", len(compressed), dump_done - start,
+                                     time.perf_counter() - dump_done)
+
+    def _hydrate(self, report_id):
+        report = self._cold_cache.get(report_id)
+        if report is None:
+            report = self.read_cold(report_id)
+            self._cold_cache[report_id] = report
+            if len(self._cold_cache) > COLD_CACHE_SIZE:
+                self._cold_cache.popitem(last=False)
+        else:
+            self._cold_cache.move_to_end(report_id)
+        return report
+
+    def _drop_cold(self, report_id):
+        self._cold_cache.pop(report_id, None)
+        if self.backups is not None:
+            self.backups.preserve(self.cold_path(report_id))
+        try:
+            os.remove(self.cold_path(report_id))
+        except FileNotFoundError:
+            pass
+
+    def _demote_eligible(self, shard):
+        now = datetime.now()
+        moved = 0
+        for i, report in enumerate(shard.reports):
+            if not is_cold(report) and report.get('id') and should_be_cold(report, now):
+                self.write_cold(report)
+                shard.reports[i] = summarize(report)
+                self.index[report['id']] = shard.reports[i]
+                moved += 1
+        return moved
+
+    @staticmethod
+    def _position(shard, entry):
+        for i, report in enumerate(shard.reports):
+            if report is entry:
+                return i
+        raise KeyError(entry.get('id'))
+
+
+store = ReportStore()
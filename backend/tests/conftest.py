@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by bare name (uvicorn runs main:app from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run against an empty data directory; the store uses paths relative to it"""
+    monkeypatch.chdir(tmp_path)
+    import main
+    main.store.reset()
+    yield tmp_path
+    main.store.reset()
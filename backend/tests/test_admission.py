@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import admission
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def slow_app(scope, receive, send):
+    await asyncio.sleep(0.05)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def request(path="/x", method="GET"):
+    return {"type": "http", "method": method, "path": path, "headers": []}
+
+
+async def call(app, scope):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+
+def test_classify():
+    assert admission.classify("GET", "/landfill-reports") == "reads"
+    assert admission.classify("POST", "/landfill-reports/P1/attachments") == "uploads"
+    assert admission.classify("POST", "/landfill-reports/import") == "uploads"
+    assert admission.classify("PUT", "/landfill-report/row/3") == "writes"
+    assert admission.classify("GET", "/health") is None
+    assert admission.classify("POST", "/admin/backups") is None
+    assert admission.classify("OPTIONS", "/landfill-reports") is None
+
+
+def test_full_queue_gets_429_and_late_requests_503():
+    app = admission.AdmissionMiddleware(slow_app, {"reads": (1, 1, 0.01), "writes": (1, 1, 1.0)})
+
+    async def burst(path, method, count):
+        return await asyncio.gather(*[call(app, request(path, method)) for _ in range(count)])
+
+    writes = run(burst("/y", "POST", 3))
+    assert sorted(status for status, _ in writes) == [200, 200, 429]
+    assert all(b"retry-after" in headers for status, headers in writes if status != 200)
+
+    reads = run(burst("/x", "GET", 2))
+    assert sorted(status for status, _ in reads) == [200, 503]
+    for limiter in app.limiters.values():
+        assert limiter.in_flight == 0 and not limiter._waiters
+
+
+@pytest.mark.parametrize("delay", [0, 0.01, 0.07])
+def test_cancelled_requests_give_their_slot_back(delay):
+    """Cancelled while admitted-but-not-started, while running, or while queued"""
+    app = admission.AdmissionMiddleware(slow_app, {"writes": (1, 4, 1.0)})
+
+    async def scenario():
+        first = asyncio.ensure_future(call(app, request("/y", "POST")))
+        second = asyncio.ensure_future(call(app, request("/y", "POST")))
+        await asyncio.sleep(delay)
+        first.cancel()
+        second.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        return await call(app, request("/y", "POST"))
+
+    status, _ = run(scenario())
+    assert status == 200
+    assert app.limiters["writes"].in_flight == 0
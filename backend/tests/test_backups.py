@@ -0,0 +1,61 @@
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import backups
+import main
+
+
+def apply(fn, *args):
+    return fn(*args)
+
+
+@pytest.fixture
+def manager(data_dir):
+    manager = main.backup_manager
+    manager.install()
+    yield manager
+    manager.close()
+
+
+def report(report_id, title):
+    return {"id": report_id, "version": 1, "status": "draft", "company_id": "tpi",
+            "report_info": {"title": title}, "data_rows": [{"id": 1, "ton": 1.0}]}
+
+
+def test_restore_replays_the_journal_up_to_the_requested_time(manager):
+    main.store.add(report("P8000", "original"))
+    manager.backup(apply)
+
+    edited = main.store.get("P8000")
+    edited["report_info"]["title"] = "edited"
+    main.store.save_report(edited)
+    time.sleep(0.01)
+    target = datetime.now()
+    time.sleep(0.01)
+
+    later = main.store.get("P8000")
+    later["report_info"]["title"] = "edited again"
+    main.store.save_report(later)
+    main.store.add(report("P8001", "new"))
+
+    result = manager.restore(apply, target.isoformat())
+    assert result["journal_entries_replayed"] == 1
+    assert main.store.get("P8000")["report_info"]["title"] == "edited"
+    assert main.store.get("P8001") is None
+
+    # The restore took a backup of the state it replaced, so it can be undone
+    before = next(b for b in manager.list() if b["name"] == result["backup_before_restore"])
+    manager.restore(apply, before["created_at"])
+    assert main.store.get("P8000")["report_info"]["title"] == "edited again"
+    assert main.store.get("P8001")["report_info"]["title"] == "new"
+
+
+def test_restore_job_fails_when_there_is_no_earlier_backup(manager):
+    main.store.add(report("P8000", "original"))
+    manager.backup(apply)
+    ctx = SimpleNamespace(apply=apply, progress=lambda *args: None)
+    with pytest.raises(backups.RestoreError):
+        main.restore_job(ctx, {"timestamp": "2000-01-01T00:00:00"})
@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.mark.parametrize("priority", [None, "high", [1]])
+def test_non_integer_priority_is_rejected(data_dir, priority):
+    response = TestClient(main.app).post("/jobs", json={"type": "tier_reports", "priority": priority})
+    assert response.status_code == 400
+    assert "Priority must be an integer" in response.json()["error"]
+    assert main.jobs.queue.list(None, None, 100) == []
+
+
+@pytest.mark.parametrize("job_type", ["ocr", "backup", "restore"])
+def test_only_client_job_types_can_be_submitted(data_dir, job_type):
+    response = TestClient(main.app).post("/jobs", json={
+        "type": job_type,
+        "params": {"report_id": "P8000", "attachment": "a", "file_name": "f", "file_path": "/etc/passwd"},
+    })
+    assert response.status_code == 400
+    assert main.jobs.queue.list(None, None, 100) == []
+
+
+def test_ocr_only_reads_the_reports_own_attachments(data_dir):
+    (data_dir / "secret.txt").write_text("secret")
+    (data_dir / "attachments" / "P8000").mkdir(parents=True)
+    (data_dir / "attachments" / "P8000" / "scan.pdf").write_bytes(b"%PDF-1.4")
+    main.store.add({"id": "P8000", "version": 1, "company_id": "tpi", "data_rows": [],
+                    "attachments": [{"saved_filename": "scan.pdf"}, {"saved_filename": "../../secret.txt"}]})
+
+    assert main.ocr_attachment_path("P8000", "scan.pdf") == str((data_dir / "attachments" / "P8000" / "scan.pdf").resolve())
+    with pytest.raises(ValueError):
+        main.ocr_attachment_path("P8000", "../../secret.txt")
+    with pytest.raises(ValueError):
+        main.ocr_attachment_path("P8000", "other.pdf")
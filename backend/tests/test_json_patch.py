@@ -0,0 +1,103 @@
+import pytest
+
+from json_patch import PatchConflict, PatchError, apply_merge_patch, apply_patch, parse_pointer, rollback
+
+
+def document():
+    return {"name": "r", "rows": [{"id": 1, "ton": 1.0}, {"id": 2, "ton": 2.0}], "info": {"a/b": 1, "c~d": 2}}
+
+
+def test_parse_pointer_unescapes_tokens():
+    assert parse_pointer("") == []
+    assert parse_pointer("/info/a~1b") == ["info", "a/b"]
+    assert parse_pointer("/info/c~0d") == ["info", "c~d"]
+    with pytest.raises(PatchError):
+        parse_pointer("info")
+
+
+def test_add_remove_replace():
+    doc = document()
+    changed = apply_patch(doc, [
+        {"op": "add", "path": "/rows/-", "value": {"id": 3}},
+        {"op": "add", "path": "/rows/0", "value": {"id": 0}},
+        {"op": "remove", "path": "/rows/1"},
+        {"op": "replace", "path": "/name", "value": "s"},
+        {"op": "add", "path": "/info/e", "value": 5},
+    ])
+    assert [row["id"] for row in doc["rows"]] == [0, 2, 3]
+    assert doc["name"] == "s" and doc["info"]["e"] == 5
+    assert changed == ["/rows/-", "/rows/0", "/rows/1", "/name", "/info/e"]
+
+
+def test_move_and_copy():
+    doc = document()
+    apply_patch(doc, [
+        {"op": "copy", "from": "/rows/0", "path": "/first"},
+        {"op": "move", "from": "/info/a~1b", "path": "/moved"},
+    ])
+    assert doc["first"] == {"id": 1, "ton": 1.0} and doc["first"] is not doc["rows"][0]
+    assert doc["moved"] == 1 and "a/b" not in doc["info"]
+    with pytest.raises(PatchError):
+        apply_patch(doc, [{"op": "move", "from": "/info", "path": "/info/inner"}])
+
+
+def test_test_operation():
+    doc = document()
+    apply_patch(doc, [{"op": "test", "path": "/rows/1/ton", "value": 2.0}])
+    with pytest.raises(PatchConflict):
+        apply_patch(doc, [{"op": "test", "path": "/name", "value": "other"}])
+
+
+@pytest.mark.parametrize("operations", [
+    [{"op": "replace", "path": "/name", "value": "x"}, {"op": "remove", "path": "/missing"}],
+    [{"op": "remove", "path": "/rows/0"}, {"op": "add", "path": "/rows/9", "value": {}}],
+    [{"op": "move", "from": "/rows/0", "path": "/first"}, {"op": "test", "path": "/name", "value": "no"}],
+    [{"op": "add", "path": "/info/new", "value": 1}, {"op": "bogus", "path": "/name"}],
+])
+def test_failed_operation_rolls_back_earlier_ones(operations):
+    doc = document()
+    with pytest.raises(PatchError):
+        apply_patch(doc, operations)
+    assert doc == document()
+
+
+def test_undo_steps_are_kept_for_the_caller():
+    doc = document()
+    undo = []
+    apply_patch(doc, [{"op": "remove", "path": "/rows/0"}, {"op": "replace", "path": "/name", "value": "x"}],
+                undo=undo)
+    assert doc != document()
+    rollback(undo)
+    assert doc == document() and undo == []
+
+
+def test_protected_paths():
+    doc = document()
+    with pytest.raises(PatchError, match="read-only"):
+        apply_patch(doc, [{"op": "replace", "path": "/name", "value": "x"}], protected=("/name",))
+    with pytest.raises(PatchError, match="read-only"):
+        apply_patch(doc, [{"op": "move", "from": "/rows", "path": "/x"}], protected=("/rows",))
+    apply_patch(doc, [{"op": "test", "path": "/name", "value": "r"}], protected=("/name",))
+    assert doc == document()
+
+
+def test_merge_patch():
+    doc = document()
+    changed = apply_merge_patch(doc, {"name": "s", "info": {"c~d": None, "e": {"f": 1, "g": None}}})
+    assert doc["name"] == "s"
+    assert doc["info"] == {"a/b": 1, "e": {"f": 1}}
+    assert changed == ["/name", "/info/c~0d", "/info/e"]
+    assert apply_merge_patch(doc, {"name": "s"}) == []
+
+
+def test_merge_patch_rolls_back_and_protects():
+    doc = document()
+    with pytest.raises(PatchError, match="read-only"):
+        apply_merge_patch(doc, {"name": "x", "info": {"a/b": 5}}, protected=("/info/a~1b",))
+    assert doc == document()
+    undo = []
+    apply_merge_patch(doc, {"name": None, "rows": "garbage", "new": 1}, undo=undo)
+    rollback(undo)
+    assert doc == document()
+    with pytest.raises(PatchError):
+        apply_merge_patch(doc, ["not", "an", "object"])
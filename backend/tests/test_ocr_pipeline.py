@@ -0,0 +1,18 @@
+import ocr_pipeline
+
+
+def test_row_from_line_reads_statement_columns():
+    row = ocr_pipeline.row_from_line("10.5 1,000 10,500.00 735.00 11,235.00 week one")
+    assert row == {"total_ton": 10.5, "baht_per_ton": 1000.0, "amount": 10500.0, "vat": 735.0,
+                   "total": 11235.0, "remark": "week one"}
+
+
+def test_hyphenated_dates_are_not_negative_numbers():
+    line = "15.พรีเฟอริโอ้ Landfill งวด 1-15-09-2025.pdf"
+    assert [m.group() for m in ocr_pipeline.NUMBER_RE.finditer(line)] == ["15"]
+    assert ocr_pipeline.row_from_line(line) is None
+
+
+def test_rows_with_negative_tonnage_or_amount_are_skipped():
+    assert ocr_pipeline.row_from_line("-2 100 -200 -14 -214") is None
+    assert ocr_pipeline.row_from_line("2 100 200 14 214")["amount"] == 200.0
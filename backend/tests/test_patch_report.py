@@ -0,0 +1,97 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+MERGE = {"Content-Type": "application/merge-patch+json"}
+JSON_PATCH = {"Content-Type": "application/json-patch+json"}
+
+
+def row(row_id, ton):
+    return {"id": row_id, "ton": ton, "total_ton": ton, "pricing_type": "fixed", "baht_per_ton": 100.0,
+            "amount": ton * 100, "vat": ton * 7, "total": ton * 107}
+
+
+@pytest.fixture
+def client(data_dir):
+    rows = [row(1, 1.0), row(2, 2.0)]
+    main.store.add({
+        "id": "P8000", "version": 1, "status": "draft", "company_id": "tpi",
+        "date_range": {"start_date": "2026-01-01", "end_date": "2026-01-31", "period": "January 2026"},
+        "source": {"type": "manual"},
+        "report_info": {"title": "January"}, "data_rows": rows, "totals": main.calculate_totals(rows),
+        "additional_info": {}, "audit_trail": [],
+    })
+    return TestClient(main.app)
+
+
+def test_merge_patch_updates_totals(client):
+    response = client.patch("/all-reports/P8000", params={"base_version": 1}, headers=MERGE,
+                            json={"report_info": {"title": "Renamed"}})
+    assert response.status_code == 200
+    assert response.json()["changed_paths"] == ["/report_info/title"]
+
+    response = client.patch("/all-reports/P8000", params={"base_version": 2}, headers=JSON_PATCH,
+                            json=[{"op": "replace", "path": "/data_rows/1/ton", "value": 5.0}])
+    assert response.status_code == 200
+    assert response.json()["totals"]["ton"] == 6.0
+    assert client.get("/all-reports/P8000").json()["version"] == 3
+
+
+@pytest.mark.parametrize("headers,patch", [
+    (MERGE, {"data_rows": "garbage"}),
+    (MERGE, {"report_info": "garbage", "status": "published"}),
+    (JSON_PATCH, [{"op": "replace", "path": "/data_rows/0", "value": 42}]),
+    (JSON_PATCH, [{"op": "add", "path": "/data_rows/-", "value": {"ton": "heavy"}}]),
+    (MERGE, {"company_id": None}),
+])
+def test_invalid_result_is_rejected_and_undone(client, headers, patch):
+    before = client.get("/all-reports/P8000").json()
+    response = client.patch("/all-reports/P8000", params={"base_version": 1}, headers=headers, json=patch)
+    assert response.status_code == 422
+    assert response.json()["details"]
+    assert client.get("/all-reports/P8000").json() == before
+
+
+def test_protected_and_tier_fields(client):
+    for field in ("id", "version", "audit_trail", "totals", "tier", "row_count"):
+        response = client.patch("/all-reports/P8000", params={"base_version": 1}, headers=MERGE, json={field: "x"})
+        assert response.status_code == 422, field
+
+
+def test_if_match_takes_the_report_etag(client):
+    etag = client.get("/all-reports/P8000").headers["etag"]
+    assert etag.startswith('W/"v1-')
+    response = client.patch("/all-reports/P8000", headers={**MERGE, "If-Match": etag}, json={"status": "locked"})
+    assert response.status_code == 200
+
+    stale = client.patch("/all-reports/P8000", headers={**MERGE, "If-Match": etag}, json={"status": "draft"})
+    assert stale.status_code == 409
+    assert stale.json()["version"] == 2
+
+    list_etag = client.get("/all-reports").headers["etag"]
+    response = client.patch("/all-reports/P8000", headers={**MERGE, "If-Match": list_etag}, json={"status": "draft"})
+    assert response.status_code == 428
+
+
+def test_failed_test_operation_is_a_conflict(client):
+    response = client.patch("/all-reports/P8000", params={"base_version": 1}, headers=JSON_PATCH, json=[
+        {"op": "replace", "path": "/status", "value": "published"},
+        {"op": "test", "path": "/data_rows/0/ton", "value": 99},
+    ])
+    assert response.status_code == 409
+    assert client.get("/all-reports/P8000").json()["status"] == "draft"
+
+
+def test_only_the_edited_rows_are_validated(client):
+    # An older row that no longer validates does not block edits to other rows
+    main.store.get("P8000")["data_rows"].append({"id": 3, "ton": 1.0})
+
+    response = client.patch("/all-reports/P8000", params={"base_version": 1}, headers=JSON_PATCH,
+                            json=[{"op": "replace", "path": "/data_rows/0/ton", "value": 5.0}])
+    assert response.status_code == 200
+
+    response = client.patch("/all-reports/P8000", params={"base_version": 2}, headers=JSON_PATCH,
+                            json=[{"op": "replace", "path": "/data_rows/1/ton", "value": "heavy"}])
+    assert response.status_code == 422
+    assert [error["loc"] for error in response.json()["details"]] == [["data_rows", 1, "ton"]]
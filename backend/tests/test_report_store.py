@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import report_store
+
+
+def report(report_id, **fields):
+    return {"id": report_id, "version": 1, "status": "draft", "company_id": "tpi",
+            "report_info": {"title": report_id}, "data_rows": [{"id": 1, "ton": 1.0}], **fields}
+
+
+def test_add_refuses_a_taken_id(data_dir):
+    main.store.add(report("P8000"))
+    with pytest.raises(ValueError, match="already exists"):
+        main.store.add(report("P8000", status="published"))
+    assert main.store.get("P8000")["status"] == "draft"
+
+
+def test_new_reports_get_counter_ids(data_dir):
+    client = TestClient(main.app)
+    first = client.post("/landfill-reports", json={"company_id": "tpi"}).json()["report_id"]
+    second = client.post("/all-reports", json=report(None)).json()["report_id"]
+    assert first.startswith("P") and int(second[1:]) == int(first[1:]) + 1
+
+
+def test_cold_summary_is_never_saved_over_the_report(data_dir):
+    main.store.add(report("P8000", status="archived"))
+    summary = main.store.entries(["P8000"])[0]
+    assert report_store.is_cold(summary)
+    with pytest.raises(ValueError):
+        main.store.save_report(dict(summary))
+    with pytest.raises(ValueError):
+        main.store.replace("P8000", dict(summary))
+
+    client = TestClient(main.app)
+    response = client.put("/all-reports/P8000", json=dict(summary, name="renamed"))
+    assert response.status_code == 409
+    assert main.store.get("P8000")["data_rows"] == [{"id": 1, "ton": 1.0}]
+
+
+def test_tier_markers_are_stripped_from_saved_reports(data_dir):
+    main.store.add(report("P8000", tier="hot", row_count=9))
+    stored = main.store.get("P8000")
+    assert "tier" not in stored and "row_count" not in stored
+
+
+def test_all_reports_returns_cold_reports_in_full(data_dir):
+    main.store.add(report("P8000", status="archived"))
+    main.store.add(report("P8001"))
+    client = TestClient(main.app)
+
+    reports = {r["id"]: r for r in client.get("/all-reports").json()["reports"]}
+    assert reports["P8000"]["data_rows"] == [{"id": 1, "ton": 1.0}]
+    assert not report_store.is_cold(reports["P8000"])
+
+    summaries = {r["id"]: r for r in client.get("/all-reports", params={"summaries": True}).json()["reports"]}
+    assert report_store.is_cold(summaries["P8000"]) and "data_rows" not in summaries["P8000"]
+    assert summaries["P8001"]["data_rows"] == [{"id": 1, "ton": 1.0}]
+
+
+def test_clients_cannot_set_tier_markers(data_dir):
+    main.store.add(report("P8000"))
+    main.set_active_report_id("P8000")
+    client = TestClient(main.app)
+    client.post("/landfill-reports/P8000/lock", params={"user_id": "u"})
+
+    response = client.post("/landfill-reports/P8000/save", params={"user_id": "u"}, json={"tier": "cold"})
+    assert response.json()["version"] == 2
+    client.put("/landfill-report", json={"tier": "cold", "row_count": 0})
+    stored = client.get("/all-reports/P8000").json()
+    assert stored["version"] == 3 and stored["data_rows"] == [{"id": 1, "ton": 1.0}]
+
+
+def test_failed_write_leaves_memory_as_on_disk(data_dir, monkeypatch):
+    main.store.add(report("P8000"))
+
+    def fail(shard):
+        raise OSError("disk full")
+    monkeypatch.setattr(report_store.Shard, "write", fail)
+    edited = main.store.get("P8000")
+    edited["status"] = "published"
+    with pytest.raises(OSError):
+        main.save_report(edited)
+    assert main.store.get("P8000")["status"] == "draft"
+
+
+def test_id_allocation_reads_the_store_only_to_seed_the_counter(data_dir, monkeypatch):
+    main.store.add(report("P9000"))
+    monkeypatch.setattr(main, "next_report_number", None)
+    assert main.allocate_report_id() == "P9001"
+
+    def scan():
+        raise AssertionError("summaries read after the counter was seeded")
+    monkeypatch.setattr(main.store, "summaries", scan)
+    response = TestClient(main.app).post("/all-reports", json=report(None))
+    assert response.json()["report_id"] == "P9002"
+
+
+@pytest.mark.parametrize("legacy_version, kept", [(3, "legacy"), (1, "store")])
+def test_legacy_active_report_migration_keeps_the_newer_copy(data_dir, legacy_version, kept):
+    main.store.add(report("P8000", version=2, report_info={"title": "store"}))
+    legacy = report("P8000", version=legacy_version, report_info={"title": "legacy"})
+    (data_dir / main.landfill_data_file).write_text(json.dumps(legacy))
+
+    assert main.get_active_report()["report_info"]["title"] == kept
+    assert json.loads((data_dir / main.landfill_data_file).read_text()) == {"active_report_id": "P8000"}
+    assert json.loads((data_dir / f"{main.landfill_data_file}.pre-migration").read_text()) == legacy